@@ -0,0 +1,75 @@
+import os
+import re
+import sys
+import glob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+from klmc_tools.fs_ops import move_trees
+from klmc_tools.restart_plan import compact_ranges, format_ranges
+from klmc_tools.results_store import SYMMETRY_SCHEMA, to_frame, write_results
+from klmc_tools.site_index import SiteIndex, canonical_key, read_atom_rows
+
+# Usage (in the directory with the KLMC A*.gin inputs, before the GULP task farm):
+#   python 00_symmetry_screen.py           write symmetry_screen.parquet, report the savings
+#   python 00_symmetry_screen.py --apply   also move the redundant inputs to ../symmetry_duplicates/
+#
+# Configurations equivalent under the supercell symmetry (Master.gin) give the same
+# energy; one representative per orbit is kept and 'multiplicity' carries the orbit
+# size for the Boltzmann weights downstream.
+
+master_file_path = "../data/Master.gin"
+duplicates_dir = "../symmetry_duplicates"
+max_workers = None  # None: use the cores allocated by Slurm
+
+_index = None
+_perms = None
+
+def init_worker(index, perms):
+    global _index, _perms
+    _index, _perms = index, perms
+
+def screen_file(file_path):
+    return canonical_key(_index.labels(read_atom_rows(file_path)), _perms)
+
+def main():
+    index = SiteIndex.from_gin(master_file_path)
+    perms = index.space_group_permutations()
+    print(f"Master: {len(index)} sites, {len(perms)} symmetry operations")
+
+    files = sorted(glob.glob("A*.gin"), key=lambda x: int(re.findall(r'\d+', x)[0]))
+    keys = dict(map_chunked(screen_file, files, max_workers=max_workers, label="inputs",
+                            initializer=init_worker, initargs=(index, perms)))
+
+    # the lowest taskid of every orbit is its representative
+    orbits = {}
+    for file_path in files:
+        if file_path in keys:
+            orbits.setdefault(keys[file_path][0], []).append(int(re.findall(r'\d+', file_path)[0]))
+    records = []
+    for file_path in files:
+        if file_path not in keys:
+            continue
+        key, multiplicity = keys[file_path]
+        members = orbits[key]
+        records.append({
+            "taskid": int(re.findall(r'\d+', file_path)[0]),
+            "orbit_key": key,
+            "representative": members[0],
+            "duplicates": len(members),
+            "multiplicity": multiplicity,
+        })
+    df = to_frame(records, SYMMETRY_SCHEMA)
+    write_results(df, "symmetry_screen.parquet")
+
+    redundant = df[df["taskid"] != df["representative"]]
+    kept = df.loc[df["taskid"] == df["representative"], "taskid"].tolist()
+    print(f"Inputs: {len(df)} | orbits: {len(orbits)} | redundant: {len(redundant)}")
+
+    if "--apply" in sys.argv and len(redundant):
+        print(move_trees([f"A{taskid}.gin" for taskid in redundant["taskid"]], duplicates_dir))
+        print(f"Task ranges left to run: {format_ranges(compact_ranges(kept))}")
+    print("Completed, symmetry screen saved to symmetry_screen.parquet")
+
+if __name__ == "__main__":
+    main()
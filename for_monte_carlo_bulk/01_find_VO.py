@@ -1,38 +1,75 @@
-import glob
+import os
 import re
+import sys
+import glob
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+from klmc_tools.results_store import SITE_SCHEMA, VACANCY_SCHEMA, write_results
+from klmc_tools.site_index import SiteIndex, read_atom_rows
+
+# Usage (in the directory with the A*.gin files):
+#   python 01_find_VO.py          VO_sites.parquet (taskid, site_id) + master_sites.parquet
+#   python 01_find_VO.py --text   also the old VO_position.txt ('A<n> x y z' per vacancy)
 
 # Path to the Master.gin file
 master_file_path = "../data/Master.gin"
+max_workers = None  # None: use the cores allocated by Slurm
+
+_index = None
+
+def init_worker(index):
+    global _index
+    _index = index
+
+def find_vacancies(file_path):
+    # occupied sites as a bitset; the vacancies are the master sites whose bit is clear
+    bits, unmatched = _index.occupied_bits(read_atom_rows(file_path))
+    return _index.vacant_sites(bits).astype(np.int32), unmatched
+
+def main():
+    # One integer site index of Master.gin: coordinate -> site id
+    index = SiteIndex.from_gin(master_file_path)
+    sites = pd.DataFrame({
+        "site_id": np.arange(len(index), dtype=np.int32),
+        "species": index.species,
+        "x": index.frac[:, 0],
+        "y": index.frac[:, 1],
+        "z": index.frac[:, 2],
+    }).astype(SITE_SCHEMA)
+    write_results(sites, "master_sites.parquet")
+
+    # Get a list of all A*.gin files and sort them by the numerical part of the filename
+    files = sorted(glob.glob("A*.gin"), key=lambda x: int(re.findall(r'\d+', x)[0]))
+    results = dict(map_chunked(find_vacancies, files, max_workers=max_workers, label="files",
+                               initializer=init_worker, initargs=(index,)))
+
+    taskids, site_ids = [], []
+    for file_path in files:
+        if file_path not in results:
+            continue
+        vacant, unmatched = results[file_path]
+        if unmatched:
+            print(f"{file_path}: {unmatched} atoms are not on a Master.gin site")
+        taskids.append(np.full(len(vacant), int(re.findall(r'\d+', file_path)[0]), dtype=np.int64))
+        site_ids.append(vacant)
+    table = pd.DataFrame({
+        "taskid": np.concatenate(taskids) if taskids else np.zeros(0, dtype=np.int64),
+        "site_id": np.concatenate(site_ids) if site_ids else np.zeros(0, dtype=np.int32),
+    }).astype(VACANCY_SCHEMA)
+    write_results(table, "VO_sites.parquet")
+
+    if "--text" in sys.argv:
+        coords = sites.set_index("site_id").loc[table["site_id"], ["x", "y", "z"]].to_numpy()
+        with open("VO_position.txt", "w") as output_file:
+            for taskid, (x, y, z) in zip(table["taskid"], coords):
+                output_file.write(f"A{taskid} {x:.6f} {y:.6f} {z:.6f}\n")
+
+    print(f"Completed, {len(table)} vacancies in {len(results)} files saved to VO_sites.parquet "
+          f"(site coordinates in master_sites.parquet).")
 
-# Read coordinates from Master.gin file
-master_coords = set()
-with open(master_file_path, "r") as master_file:
-    for line in master_file:
-        if "0 1 0 1 1 1" in line:
-            coords = tuple(line.split()[2:5])
-            master_coords.add(coords)
-
-# Get a list of all A*.gin files and sort them by the numerical part of the filename
-files = sorted(glob.glob("A*.gin"), key=lambda x: int(re.findall(r'\d+', x)[0]))
-total_files = len(files)
-
-# Iterate through sorted A*.gin files
-with open("VO_position.txt", "w") as output_file:
-    for index, file_path in enumerate(files):
-        file_coords = set()
-        with open(file_path, "r") as file:
-            for line in file:
-                if "0 1 0 1 1 1" in line:
-                    coords = tuple(line.split()[2:5])
-                    file_coords.add(coords)
-
-        # Check if coordinates from Master.gin are missing in the A*.gin file
-        missing_coords = master_coords - file_coords
-        for coords in missing_coords:
-            # Write the name of the A*.gin file (without extension), followed by the missing coordinates
-            output_file.write(f"{file_path.split('.')[0]} {' '.join(coords)}\n")
-
-        # Print progress
-        print(f"Processed {index + 1} out of {total_files} files ({(index + 1) / total_files * 100:.2f}% complete).")
-
-print("Completed, missing atomic coordinates have been saved to VO_position.txt file.")
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,48 @@
 import os
-import re
-import glob
-from concurrent.futures import ProcessPoolExecutor
+import sys
 
-max_workers = 64
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.results_store import TASK_STATUS_SCHEMA, to_frame, write_results
+from klmc_tools.task_scan import scan_tasks
 
-def check_gulp_res(directory):
-    return directory if not os.path.isfile(os.path.join(directory, 'gulp.res')) else None
+max_workers = None  # None: use the cores allocated by Slurm
 
-def check_for_error(gout_path):
-    with open(gout_path, 'r') as file:
-        for line in file:
-            if "ERROR" in line:
-                return gout_path
-    return None
+# One scandir walk: every A*/ directory is visited once for the gulp.res check, ERROR and totalenergy
+records = scan_tasks('.', sentinel='gulp.res', max_workers=max_workers)
 
-def grep_energy(res_path):
-    with open(res_path, 'r') as file:
-        for line in file:
-            if "totalenergy" in line:
-                return line.strip()
-    return None
-    
-def sort_key_func(x):
-    nums = re.findall(r'\d+', x)
-    if nums:
-        return int(nums[0])
-    else:
-        return 0  # or any other fallback value
+# Status table: taskid, status (missing/error/ok), energy
+write_results(to_frame(records, TASK_STATUS_SCHEMA), 'task_status.parquet')
 
-# Step 1: Find unfinished calculations without gulp.res and generate restart list
-directories = sorted(glob.glob('A*/'))
-
-with ProcessPoolExecutor(max_workers=max_workers) as executor:
-    restart_list = list(filter(None, executor.map(check_gulp_res, directories)))
+# Step 1: Unfinished calculations without gulp.res -> restart list
+missing = [record for record in records if record['status'] == 'missing']
+restart_list = [f"{record['directory']}/" for record in missing]
 
 with open('restart_list.txt', 'w') as file:
     file.write('\n'.join(restart_list))
 
 if restart_list:
-    num_start = int(re.findall(r'\d+', restart_list[0])[0])
+    num_start = missing[0]['taskid']
     print(f"Restart from No.: {num_start}")
 else:
     print("No restart is needed.")
 print("Step 1: Check Restart : ok")
 
-# Step 2: Find error calculations and generate error list
-gout_paths = glob.glob('A*/*.gout')
-
-with ProcessPoolExecutor(max_workers=max_workers) as executor:
-    error_list = list(filter(None, executor.map(check_for_error, gout_paths)))
+# Step 2: Error calculations -> error list
+error_list = [path for record in records for path in record['error_files']]
 
 with open('error.txt', 'w') as file:
     file.write('\n'.join(error_list))
 
 print("Step 2: ok")
 print("Content of error.txt:")
-with open('error.txt', 'r') as file:
-    print(file.read())
-
-# Step 3: Grep energy
-res_paths = sorted(glob.glob('*/gulp.res'), key=sort_key_func)
+print('\n'.join(error_list))
 
-with ProcessPoolExecutor(max_workers=max_workers) as executor:
-    energy_data = list(filter(None, executor.map(grep_energy, res_paths)))
+# Step 3: Energies from gulp.res
+energy_data = [record['energy_line'] for record in records if record['energy_line']]
 
 with open('energy.txt', 'w') as file:
     file.write('\n'.join(energy_data))
 
 print("Step 3: Grep Energy : ok")
+print(f"Tasks: {len(records)} | missing: {len(restart_list)} | error: {sum(record['status'] == 'error' for record in records)}")
 print("...done")
@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+import glob
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+from klmc_tools.neighbours import Neighbours
+from klmc_tools.results_store import LA_CLASS_SCHEMA, VO_CLASS_SCHEMA, write_results
+from klmc_tools.site_index import SiteIndex, read_atom_rows
+
+# Usage (in the directory with the A*.gin files):
+#   python 05_classify_VO.py     VO_classes.parquet (per vacancy) + La_classes.parquet (per La)
+#
+# The categories of for_monte_carlo_nanoparticle/03_VO_Ce.py, with distances taken
+# through the periodic boundaries of the supercell (minimum image).
+
+# Path to the Master.gin file
+master_file_path = "../data/Master.gin"
+dopant = "La"
+max_workers = None  # None: use the cores allocated by Slurm
+
+_index = None
+
+def init_worker(index):
+    global _index
+    _index = index
+
+def classify_distance(d):
+    # VO-La: 2N below 3 A, 3N from 3 to 5 A
+    return np.select([d < 3, d <= 5], ['2N', '3N'], 'fN')
+
+def classify_vo_distance(d):
+    return np.select([d < 3.3, d < 4.2, d < 5.1], ['VO_100', 'VO_110', 'VO_111'], 'VO_far')
+
+def classify_la_distance(d):
+    return np.select([d < 4.6, d < 6], ['La_1N', 'La_2N'], 'La_far')
+
+def classify_file(file_path):
+    rows = read_atom_rows(file_path)
+    bits, _ = _index.occupied_bits(rows)
+    vacant = _index.vacant_sites(bits)
+    la_rows = [xyz for name, xyz in rows if name == dopant]
+    # core and shell rows of one La share a site: one entry per master site
+    la_ids = np.unique(_index.site_ids(la_rows)) if la_rows else np.zeros(0, dtype=np.int64)
+    la_ids = la_ids[la_ids >= 0]
+
+    vo_sites = Neighbours.from_frac(_index.frac[vacant], _index.cell)
+    la_sites = Neighbours.from_frac(_index.frac[la_ids], _index.cell)
+    d1_d2 = la_sites.nearest(vo_sites.coords, k=2)
+    # shells include their outer radius; 2N stops just below 3 A as in classify_distance
+    shells = la_sites.shell_counts(vo_sites.coords, [np.nextafter(3.0, 0.0), 5.0])
+    d3 = vo_sites.nearest(vo_sites.coords, k=1, exclude_self=True)[:, 0]
+    d4 = la_sites.nearest(la_sites.coords, k=1, exclude_self=True)[:, 0]
+
+    vo = pd.DataFrame({
+        "site_id": vacant,
+        "d1": d1_d2[:, 0],
+        "d2": d1_d2[:, 1],
+        "N1": classify_distance(d1_d2[:, 0]),
+        "N2": classify_distance(d1_d2[:, 1]),
+        "d3": d3,
+        "VO_Class": classify_vo_distance(d3),
+        "n_La_2N": shells[:, 0],
+        "n_La_3N": shells[:, 1],
+    })
+    la = pd.DataFrame({"site_id": la_ids, "d4": d4, "La_Class": classify_la_distance(d4)})
+    return vo, la
+
+def main():
+    index = SiteIndex.from_gin(master_file_path)
+
+    # Get a list of all A*.gin files and sort them by the numerical part of the filename
+    files = sorted(glob.glob("A*.gin"), key=lambda x: int(re.findall(r'\d+', x)[0]))
+    results = dict(map_chunked(classify_file, files, max_workers=max_workers, label="files",
+                               initializer=init_worker, initargs=(index,)))
+
+    vo_tables, la_tables = [], []
+    for file_path in files:
+        if file_path not in results:
+            continue
+        taskid = int(re.findall(r'\d+', file_path)[0])
+        vo, la = results[file_path]
+        vo_tables.append(vo.assign(taskid=taskid))
+        la_tables.append(la.assign(taskid=taskid))
+
+    vo_table = pd.concat(vo_tables, ignore_index=True) if vo_tables else pd.DataFrame(columns=list(VO_CLASS_SCHEMA))
+    la_table = pd.concat(la_tables, ignore_index=True) if la_tables else pd.DataFrame(columns=list(LA_CLASS_SCHEMA))
+    write_results(vo_table[list(VO_CLASS_SCHEMA)].astype(VO_CLASS_SCHEMA), "VO_classes.parquet")
+    write_results(la_table[list(LA_CLASS_SCHEMA)].astype(LA_CLASS_SCHEMA), "La_classes.parquet")
+
+    print(f"Completed, {len(vo_table)} vacancies and {len(la_table)} {dopant} in {len(results)} files "
+          f"saved to VO_classes.parquet and La_classes.parquet.")
+
+if __name__ == "__main__":
+    main()
@@ -124,47 +124,19 @@
     
 # non check
 import os
-import shutil
+import sys
 import glob
-from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.fs_ops import move_trees, remove_trees
+from klmc_tools.stage_engine import StageSpec, regenerate_inputs, valid_task_names
 
 max_workers=64
 
 def report_progress(message):
     print(f"[Progress Report] {message}")
 
-def process_name_log(dir):
-    if os.path.isdir(dir):
-        return dir.replace("./", "")
-    return None
-
-def prepare_files(name, num_jobs, i):
-    name = name.strip()
-
-    # check if restart file exist
-    if not os.path.exists(os.path.join(name, "gulp.res")):
-        report_progress(f"Skipping {name} - gulp.res not found.")
-        return
-        
-    os.chdir(name)
-    report_progress(f"Processing {i+1}/{num_jobs} - {os.getcwd()}")
-    with open("gulp.res", "r") as f_check:
-        lines = f_check.readlines()
-    totalenergy_line = next((i for i, line in enumerate(lines) if "totalenergy" in line), None)
-    if totalenergy_line is not None:
-        with open(f"{name}.gin", "w") as f:
-            f.writelines(lines[:totalenergy_line])
-    else:
-        species_line = next((i for i, line in enumerate(lines) if "species" in line), None)
-        if species_line is not None:
-            with open(f"{name}.gin", "w") as f:
-                f.writelines(lines[:species_line])
-        else:
-            shutil.copy("gulp.res", f"{name}.gin")
-    with open("../../shell_model_potential.txt", "r") as f_src, open(f"{name}.gin", "a") as f_dest:
-        f_dest.write(f_src.read())
-    shutil.copy(f"{name}.gin", "../../run")
-    os.chdir("..")
+STAGE = StageSpec("shell_model_potential.txt")
 
 def main():
     report_progress("Starting conversion...")
@@ -172,37 +144,30 @@ def main():
     # Step 1: Create directory and move files
     if not os.path.exists("_data_rigid"):
         os.mkdir("_data_rigid")
-    for file in glob.glob("A*"):
-        shutil.move(file, "_data_rigid/")
-    for dir in glob.glob("workgroup*"):
-        shutil.rmtree(dir, ignore_errors=True)
-    shutil.rmtree("run", ignore_errors=True)
+    print(move_trees(glob.glob("A*"), "_data_rigid"))
+    # old task-farm outputs and inputs are renamed away now and deleted in the
+    # background once the process pools below are done (no fork while it runs)
+    cleanup = remove_trees(glob.glob("workgroup*") + ["run"], background=True, start=False)
     os.mkdir("run")
     report_progress("Step 1: ok")
 
-    os.chdir("_data_rigid")
+    data_dir = os.path.abspath("_data_rigid")
 
-    dirs = glob.glob("A*")
-    names = []
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        for result in executor.map(process_name_log, dirs):
-            if result:
-                names.append(result)
-    with open("name.log", "w") as f:
-        f.writelines("\n".join(names))
-    
-    num_jobs = sum(1 for line in open("name.log"))
-    report_progress(f"number of jobs: {num_jobs}")
+    names = valid_task_names(data_dir)
+    with open(os.path.join(data_dir, "name.log"), "w") as name_log:
+        name_log.writelines(f"{name}\n" for name in names)
+    report_progress(f"number of jobs: {len(names)}")
 
-    # Step 3: prepare new files
-    with open("name.log", "r") as f:
-        names = f.readlines()
-    tasks = [(name, num_jobs, i) for i, name in enumerate(names)]
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        list(executor.map(prepare_files, *zip(*tasks)))
+    # Step 2: prepare new files
+    written, skipped, _ = regenerate_inputs(data_dir, names, STAGE, max_workers=max_workers)
+    for name in skipped:
+        report_progress(f"Skipping {name} - {STAGE.source} does not exist!")
+    report_progress(f"{len(written)} new inputs in run/")
 
-    report_progress("Step 3: ok")
+    cleanup.start()
+    report_progress("Step 2: ok")
     report_progress("...done")
+    report_progress(f"Cleanup: {cleanup.wait()}")
 
 if __name__ == "__main__":
     main()
@@ -228,5 +193,5 @@ def find_empty_files(directory):
     return empty_files if empty_files else "No empty files found."
 
 # Setting the directory to check as the 'run/' subdirectory in the current working directory
-directory_to_check = os.path.join(os.getcwd(), '../run/')
+directory_to_check = os.path.join(os.getcwd(), 'run/')
 print(find_empty_files(directory_to_check))
\ No newline at end of file
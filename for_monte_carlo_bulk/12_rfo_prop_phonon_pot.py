@@ -1,110 +1,57 @@
 import os
-import shutil
+import sys
 import glob
-from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.fs_ops import move_trees, remove_trees
+from klmc_tools.stage_engine import StageSpec, check_outputs, regenerate_inputs, valid_task_names
 
 max_workers=64
 
 def report_progress(message):
     print(f"[Progress Report] {message}")
 
-def process_error_and_energy_file(filepath):
-    error = None
-    energy = None
-    with open(filepath, "r") as f_check:
-        content = f_check.read()
-        if "ERROR" in content:
-            error = filepath.replace("/gulp_klmc.gout", "")
-        for line in content.splitlines():
-            if "Final energy" in line:
-                energy = line
-                break
-    return error, energy
-
-def process_directory(name, num_jobs, i):
-    name = name.strip()
-    # Check if gulp.res exists
-    if not os.path.exists(os.path.join(name, "gulp.res")):
-        report_progress(f"Skipping {i+1}/{num_jobs} - {os.path.join(name, 'gulp.res')} does not exist!")
-        return
-
-    os.chdir(name)
-    report_progress(f"Processing {i+1}/{num_jobs} - {os.getcwd()}")
-    with open("gulp.res", "r") as f_check:
-        lines = f_check.readlines()
-    totalenergy_line = next((i for i, line in enumerate(lines) if "totalenergy" in line), None)
-    if totalenergy_line is not None:
-        with open(f"{name}.gin", "w") as f:
-            f.writelines(lines[:totalenergy_line])
-    else:
-        species_line = next((i for i, line in enumerate(lines) if "species" in line), None)
-        if species_line is not None:
-            with open(f"{name}.gin", "w") as f:
-                f.writelines(lines[:species_line])
-        else:
-            shutil.copy("gulp.res", f"{name}.gin")
-    with open("../../shell_model_potential_rfo.txt", "r") as f_src, open(f"{name}.gin", "a") as f_dest:
-        f_dest.write(f_src.read())
-    with open(f"{name}.gin", "r") as f:
-        content = f.read().replace("opti ", "opti conp comp prop phonon pot")
-    with open(f"{name}.gin", "w") as f:
-        f.write(content)
-    shutil.copy(f"{name}.gin", "../../run")
-    os.chdir("..")
+STAGE = StageSpec("shell_model_potential_rfo.txt",
+                  replacements=(("opti ", "opti conp comp prop phonon pot"),))
 
 def main():
     report_progress("Starting conversion...")
 
     # Step 1: Create directory and move files
     os.makedirs("_data_shell_conp", exist_ok=True)
-    for file in glob.glob("A*"):
-        shutil.move(file, "_data_shell_conp/")
-    for dir in glob.glob("workgroup*"):
-        shutil.rmtree(dir, ignore_errors=True)
-    shutil.rmtree("run", ignore_errors=True)
+    print(move_trees(glob.glob("A*"), "_data_shell_conp"))
+    # old task-farm outputs and inputs are renamed away now and deleted in the
+    # background once the process pools below are done (no fork while it runs)
+    cleanup = remove_trees(glob.glob("workgroup*") + ["run"], background=True, start=False)
     os.makedirs("run", exist_ok=True)
     report_progress("Step 1: ok")
 
-    os.chdir("_data_shell_conp")
+    data_dir = os.path.abspath("_data_shell_conp")
 
     # Step 2: Find error calcs and Report previous energy
-    files = glob.glob("A*/gulp_klmc.gout")
-    errors = []
-    energies = []
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        for error, energy in executor.map(process_error_and_energy_file, files):
-            if error:
-                errors.append(error)
-            if energy:
-                energies.append(energy)
-    with open("error.txt", "w") as f:
-        f.writelines(errors)
-    with open("energy.txt", "w") as f:
+    errors, energies = check_outputs(data_dir, max_workers=max_workers)
+    with open(os.path.join(data_dir, "error.txt"), "w") as f:
+        f.writelines(f"{name}\n" for name in errors)
+    with open(os.path.join(data_dir, "energy.txt"), "w") as f:
         f.writelines(energies)
 
-    dir_names = [d for d in os.listdir(".") if os.path.isdir(d) and d.startswith('A')]
-    with open("name.log", "w") as name_log:
-        for name in dir_names:
-            name_log.write(name + "\n")
-
     # Delete error calcs
-    with open("error.txt", "r") as error_file, open("name.log", "r") as name_log:
-        valid_names = set(name_log.readlines()) - set(error_file.readlines())
-    with open("name.log", "w") as name_log:
-        for name in valid_names:
-            name_log.write(name)
-
-    line = len(valid_names)
-    report_progress(f"number of jobs: {line}")
+    names = valid_task_names(data_dir, errors)
+    with open(os.path.join(data_dir, "name.log"), "w") as name_log:
+        name_log.writelines(f"{name}\n" for name in names)
+    report_progress(f"number of jobs: {len(names)}")
     report_progress("Step 2: ok")
 
     # Step 3: prepare new files
-    tasks = [(name, line, i) for i, name in enumerate(valid_names)]
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        list(executor.map(process_directory, *zip(*tasks)))
+    written, skipped, _ = regenerate_inputs(data_dir, names, STAGE, max_workers=max_workers)
+    for name in skipped:
+        report_progress(f"Skipping {name} - {STAGE.source} does not exist!")
+    report_progress(f"{len(written)} new inputs in run/")
 
+    cleanup.start()
     report_progress("Step 3: ok")
     report_progress("...done")
+    report_progress(f"Cleanup: {cleanup.wait()}")
 
 if __name__ == "__main__":
     main()
@@ -130,5 +77,5 @@ def find_empty_files(directory):
     return empty_files if empty_files else "No empty files found."
 
 # Setting the directory to check as the 'run/' subdirectory in the current working directory
-directory_to_check = os.path.join(os.getcwd(), '../run/')
+directory_to_check = os.path.join(os.getcwd(), 'run/')
 print(find_empty_files(directory_to_check))
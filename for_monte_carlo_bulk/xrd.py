@@ -9,13 +9,22 @@ import Dans_Diffraction as dif
 from matplotlib.ticker import (MultipleLocator, FormatStrFormatter, AutoMinorLocator)
 from concurrent.futures import ProcessPoolExecutor
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.results_store import read_results
+
 ################################ sort energies ##########################################
 
-# Read the data from the file
-data = pd.read_csv("energy_filtered.txt", sep=" ", skipinitialspace=True)
+# Read only the columns we need from the typed results table
+data = read_results("energy_filtered.parquet", columns=["Energy", "taskid"])
+
+# Sort the data by energy and take the first 10 lines
+sorted_data = data.sort_values(by="Energy", ascending=True).head(10)
 
-# Sort the data based on the first column and take the first 10 lines
-sorted_data = data.sort_values(by=data.columns[0], ascending=True).head(10)
+# Boltzmann weights at 300 K relative to the lowest energy, one directory per taskid
+k_boltzmann = 8.617333262145e-5  # Boltzmann constant in eV/K
+temperature = 300  # Given temperature in K
+sorted_data["Weight"] = np.exp(-(sorted_data["Energy"] - sorted_data["Energy"].min()) / (k_boltzmann * temperature))
+sorted_data.index = [f"A{taskid}" for taskid in sorted_data["taskid"]]
 
 # Print the sorted data
 print(sorted_data)
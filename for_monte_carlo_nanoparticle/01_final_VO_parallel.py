@@ -1,13 +1,90 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 from scipy.spatial import KDTree
 from scipy.optimize import minimize
-import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+
 cutoff1 = 2.0 # O - O  half
 cutoff2 = 3.3  # O - Ce 1 shell
 cutoff3 = 3.55  # O - O  1 shell
 
+def implausible_sites(vo_coords, oxygen_tree):
+    """Indices of the VO sites with a relaxed oxygen closer than cutoff1."""
+    if not len(vo_coords) or not oxygen_tree.n:
+        return np.zeros(0, dtype=np.int64)
+    dists, _ = oxygen_tree.query(vo_coords, k=1, distance_upper_bound=cutoff1)
+    return np.flatnonzero(dists < cutoff1)
+
+def find_replacements(vo_coords, unreasonable, o_coords, oxygen_tree):
+    """Pair every implausible VO site with an O.txt site within cutoff3 of it.
+
+    The candidate furthest from its nearest relaxed oxygen wins (lowest index
+    on ties), and each O.txt site replaces at most one VO site.
+    Returns the VO and O.txt index arrays of the exchanges.
+    """
+    if not len(unreasonable) or not len(o_coords) or not oxygen_tree.n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # nearest relaxed oxygen of every candidate, one batched query
+    free_space, _ = oxygen_tree.query(o_coords, k=1)
+    pairs = KDTree(vo_coords[unreasonable]).sparse_distance_matrix(
+        KDTree(o_coords), cutoff3, output_type='ndarray')
+    rows, cols = pairs['i'], pairs['j']
+    # per VO site, candidates from best to worst
+    order = np.lexsort((cols, -free_space[cols], rows))
+    chosen, taken = {}, set()
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row not in chosen and col not in taken:
+            chosen[row] = col
+            taken.add(col)
+    vo_idx = np.asarray(unreasonable, dtype=np.int64)[list(chosen)]
+    return vo_idx, np.array(list(chosen.values()), dtype=np.int64)
+
+def vo_objective(positions, coord_num, cation_tree, oxygen_tree, k=6):
+    """Objective of every VO site (to be maximised) and its gradient, one batched query per tree.
+
+    4-coordinated sites move away from their k nearest cations (mean distance);
+    the others keep the mean cation distance near 2.4 A and push the k-th
+    nearest oxygen outwards. With the neighbour sets fixed, the gradient of a
+    distance |p - q| is the unit vector (p - q) / |p - q|.
+    """
+    cation_dists, cation_idx = cation_tree.query(positions, k=k)
+    o_dists, o_idx = oxygen_tree.query(positions, k=k)
+    cation_units = (positions[:, None, :] - cation_tree.data[cation_idx]) / np.maximum(cation_dists, 1e-12)[..., None]
+    o_units = (positions - oxygen_tree.data[o_idx[:, -1]]) / np.maximum(o_dists[:, -1], 1e-12)[:, None]
+
+    mean_cation = cation_dists.mean(axis=1)
+    grad_mean = cation_units.mean(axis=1)
+    four = (coord_num == 4)
+    deviation = mean_cation - 2.4
+    values = np.where(four, mean_cation, -np.abs(deviation) + o_dists[:, -1])
+    grads = np.where(four[:, None], grad_mean, -np.sign(deviation)[:, None] * grad_mean + o_units)
+    return values, grads
+
+def optimise_vo_positions(initial, cation_tree, oxygen_tree, step=1.0):
+    """Move all VO sites of a structure at once: one L-BFGS-B over the 3n coordinates, each within +-step A.
+
+    A site keeps its initial position unless its own objective improved.
+    """
+    if not len(initial):
+        return initial
+    coord_num = cation_tree.query_ball_point(initial, cutoff2, return_length=True)
+    shape = initial.shape
+
+    def negative_total(flat):
+        values, grads = vo_objective(flat.reshape(shape), coord_num, cation_tree, oxygen_tree)
+        return -values.sum(), -grads.ravel()
+
+    bounds = [(x - step, x + step) for x in initial.ravel()]
+    result = minimize(negative_total, initial.ravel(), jac=True, bounds=bounds, method='L-BFGS-B')
+    final = result.x.reshape(shape)
+    before, _ = vo_objective(initial, coord_num, cation_tree, oxygen_tree)
+    after, _ = vo_objective(final, coord_num, cation_tree, oxygen_tree)
+    return np.where((after > before)[:, None], final, initial)
+
 def process_directory(dir_path):
     """
     This function reads gulp.res and VO.txt from the specified directory,
@@ -55,16 +132,8 @@ def process_directory(dir_path):
     oxygen_tree = KDTree(all_oxygen_coords)
     vo_coords = vo_data[['X', 'Y', 'Z']].values.astype(float)
 
-    # For each VO site, compute distances to check for implausible positions
-    nn_dists = []
-    for point in vo_coords:
-        indices = oxygen_tree.query_ball_point(point, cutoff2)
-        distances = np.linalg.norm(all_oxygen_coords[indices] - point, axis=1)
-        nn_dists.append(sorted(distances)[:5])
-
-    # Identify sites with any distance less than 1.5 as implausible
-    unreasonable_indices = [i for i, dists in enumerate(nn_dists) if any(dist < cutoff1 for dist in dists)]
-    unreasonable_vo_sites = vo_data.iloc[unreasonable_indices]
+    # A VO site closer than cutoff1 to any relaxed oxygen is implausible
+    unreasonable = implausible_sites(vo_coords, oxygen_tree)
 
     # Step 3: Load O.txt to find candidate replacements
     o_file_path = os.path.join(dir_path, "O.txt")
@@ -76,58 +145,14 @@ def process_directory(dir_path):
     o_data = o_data[o_data['Element'] == 'O'].reset_index(drop=True)
     o_coords = o_data[['X', 'Y', 'Z']].values.astype(float)
 
-    def find_replacement_index(unreasonable_vo_df, all_oxy_coords, o_candidates, cutoff3=3.55):
-        replacements = []
-        o_tree = KDTree(o_candidates[['X', 'Y', 'Z']].values)  # 构建 KDTree 加速搜索
-    
-        for i, vo_site in unreasonable_vo_df.iterrows():
-            vo_position = vo_site[['X', 'Y', 'Z']].values.astype(float)
-            
-            # 在 cutoff3 半径内找到所有可能的 O²⁻ 位置
-            nearby_indices = o_tree.query_ball_point(vo_position, cutoff3)
-            nearby_positions = o_candidates[['X', 'Y', 'Z']].values[nearby_indices]
-    
-            valid_candidates = []
-            for j, candidate_position in enumerate(nearby_positions):
-                # 计算候选氧原子到所有其他氧原子的最小距离
-                distances = np.linalg.norm(all_oxy_coords - candidate_position, axis=1)
-                min_distance_to_others = np.min(distances)  # 找到最小的 O-O 距离
-                
-                # 计算候选氧原子到 VO 位置的距离
-                distance_to_vo = np.linalg.norm(candidate_position - vo_position)
-    
-                valid_candidates.append({
-                    'Index': nearby_indices[j],  # 候选氧原子的索引
-                    'Min_Distance': min_distance_to_others,  # 该位置到最近氧原子的最小距离
-                    'Distance_to_VO': distance_to_vo  # 该位置到 VO 位置的距离
-                })
-    
-            # 选择具有最大 Min_Distance 的候选氧原子
-            if valid_candidates:
-                best_candidate = max(valid_candidates, key=lambda x: x['Min_Distance'])
-                replacements.append({
-                    'VO_Index': vo_site.name,
-                    'Replacement_Index': best_candidate['Index']
-                })
-    
-        return replacements
-
-    replacements = find_replacement_index(
-        unreasonable_vo_sites, all_oxygen_coords, o_data, cutoff=cutoff3)
+    vo_idx, o_idx = find_replacements(vo_coords, unreasonable, o_coords, oxygen_tree)
 
     # Exchange corresponding atomic information between VO.txt and O.txt,
     # including 'Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type'
-    for swap in replacements:
-        vo_idx = int(swap['VO_Index'])
-        o_idx = int(swap['Replacement_Index'])
-        # Save original VO data
-        original_vo = vo_data.loc[vo_idx, ['Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type']].copy()
-        # Save candidate record from O.txt
-        candidate_o = o_data.loc[o_idx, ['Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type']].copy()
-
-        # Perform the exchange
-        vo_data.loc[vo_idx, ['Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type']] = candidate_o
-        o_data.loc[o_idx, ['Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type']] = original_vo
+    for col in ['Element', 'X', 'Y', 'Z', 'D', 'CN', 'Type']:
+        original_vo = vo_data.loc[vo_idx, col].to_numpy()
+        vo_data.loc[vo_idx, col] = o_data.loc[o_idx, col].to_numpy()
+        o_data.loc[o_idx, col] = original_vo
 
     # Step 4: In-memory optimisation
     # Extract cation records from gulp_data
@@ -135,48 +160,9 @@ def process_directory(dir_path):
     cation_coords = cation_data[['X', 'Y', 'Z']].values
     cation_tree = KDTree(cation_coords)
 
-    def count_cation_neighbour(shifted_vo):
-        indices = cation_tree.query_ball_point(shifted_vo, cutoff2)
-        return len(indices)
-
-    # Build a complete oxygen KDTree to compute distances
-    oxygen_coords = all_oxygen[['X', 'Y', 'Z']].values
-    oxygen_tree_full = KDTree(oxygen_coords)
-
-    def objective_function(shifted_vo, coord_num):
-        if np.any(np.isnan(shifted_vo)) or np.any(np.isinf(shifted_vo)):
-            return -np.inf
-
-        cation_dists, _ = cation_tree.query(shifted_vo, k=6)
-        o_dists, _ = oxygen_tree_full.query(shifted_vo, k=6)
-
-        if coord_num == 4:
-            return np.mean(cation_dists)
-        else:
-            avg_cation_dist = abs(np.mean(cation_dists) - 2.4)
-            max_o_dist = np.max(o_dists)
-            return -avg_cation_dist + max_o_dist
-
-    def optimise_vo_position(initial_pos):
-        cnum = count_cation_neighbour(initial_pos)
-        bounds = [(initial_pos[i] - 1, initial_pos[i] + 1) for i in range(3)]
-        result = minimize(
-            lambda pos: -objective_function(pos, cnum),
-            initial_pos,
-            bounds=bounds,
-            method='L-BFGS-B',
-            options={'eps': 1e-3}
-        )
-        if result.success:
-            return result.x
-        else:
-            return initial_pos
-
-    # Optimise each VO site
-    vo_coords_final = []
-    for vo in vo_data[['X', 'Y', 'Z']].values:
-        vo_coords_final.append(optimise_vo_position(vo))
-    vo_coords_final = np.array(vo_coords_final)
+    # Optimise all VO sites together
+    vo_coords_final = optimise_vo_positions(vo_data[['X', 'Y', 'Z']].values.astype(float), cation_tree,
+                                            oxygen_tree)
 
     # Update coordinates in VO data
     vo_data[['X', 'Y', 'Z']] = vo_coords_final
@@ -190,12 +176,6 @@ def process_directory(dir_path):
 if __name__ == "__main__":
     base_path = "."  # Or specify another path
     all_dirs = [d for d in os.listdir(base_path) if os.path.isdir(d) and d.startswith("A")]
-    total = len(all_dirs)
-
-    with concurrent.futures.ProcessPoolExecutor(max_workers=128) as executor:
-        futures = {executor.submit(process_directory, d): d for d in all_dirs}
-        completed = 0
-        for future in concurrent.futures.as_completed(futures):
-            completed += 1
-            progress = (completed / total) * 100
-            print(f"Completed {futures[future]}: {progress:.2f}% processed")
+
+    for _ in map_chunked(process_directory, all_dirs, label="dirs"):
+        pass
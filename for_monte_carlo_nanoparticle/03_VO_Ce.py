@@ -1,7 +1,11 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
-from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+from klmc_tools.neighbours import Neighbours
 
 def classify_distance(distance):
     """Classifies the distance between a vacancy and a lanthanum atom into coordination categories."""
@@ -43,20 +47,15 @@ def process_folder(folder):
     vo_data = pd.read_csv(vo_path, sep=r'\s+', header=None, usecols=[1, 2, 3])
     la_data = pd.read_csv(la_path, sep=r'\s+', header=None, usecols=[1, 2, 3])
 
-    # Compute pairwise distances between VO and La atoms
-    distances_vo_la = np.sqrt(np.sum((vo_data.values[:, np.newaxis, :] - la_data.values) ** 2, axis=2))
-    sorted_distances_vo_la = np.sort(distances_vo_la, axis=1)
-    d1_d2 = sorted_distances_vo_la[:, :2]  # Select the closest and second closest La atoms
-
-    # Compute pairwise distances between VO atoms
-    distances_vo_vo = np.sqrt(np.sum((vo_data.values[:, np.newaxis, :] - vo_data.values) ** 2, axis=2))
-    np.fill_diagonal(distances_vo_vo, np.inf)  # Exclude self-distance
-    d3 = np.min(distances_vo_vo, axis=1)  # Minimum VO-VO distance
+    # Nearest-neighbour distances from KD-trees (open boundaries: a nanoparticle)
+    vo_xyz = vo_data.values.astype(float)
+    la_xyz = la_data.values.astype(float)
+    vo_sites = Neighbours(vo_xyz)
+    la_sites = Neighbours(la_xyz)
 
-    # Compute pairwise distances between La atoms
-    distances_la_la = np.sqrt(np.sum((la_data.values[:, np.newaxis, :] - la_data.values) ** 2, axis=2))
-    np.fill_diagonal(distances_la_la, np.inf)  # Exclude self-distance
-    d4 = np.min(distances_la_la, axis=1)  # Minimum La-La distance
+    d1_d2 = la_sites.nearest(vo_xyz, k=2)  # Closest and second closest La atoms
+    d3 = vo_sites.nearest(vo_xyz, k=1, exclude_self=True)[:, 0]  # Minimum VO-VO distance
+    d4 = la_sites.nearest(la_xyz, k=1, exclude_self=True)[:, 0]  # Minimum La-La distance
 
     # Classify distances based on predefined criteria
     n1_n2 = np.vectorize(classify_distance)(d1_d2)
@@ -86,16 +85,10 @@ def main():
     
     # Identify directories that start with 'A'
     folders = [f for f in os.listdir('.') if os.path.isdir(f) and f.startswith('A')]
-    count = 0
-    total = len(folders)
 
     # Use parallel processing to speed up folder processing
-    with ProcessPoolExecutor(max_workers=128) as executor:
-        futures = [executor.submit(process_folder, folder) for folder in folders]
-        for future in futures:
-            future.result()  # Wait for each task to complete
-            count += 1
-            print(f"Progress: {count}/{total} folders processed ({(count / total) * 100:.2f}%)")
+    for _ in map_chunked(process_folder, folders, label="folders"):
+        pass
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,8 +1,11 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 import glob
-from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
 
 # Define the intervals
 binsize = 6
@@ -59,17 +62,6 @@ def process_directory(directory):
 
 if __name__ == "__main__":
     directories = glob.glob('A*/')
-    total_directories = len(directories)
-    completed_directories = 0
-    
-    with ProcessPoolExecutor(max_workers=128) as executor:
-        future_to_directory = {executor.submit(process_directory, directory): directory for directory in directories}
-        
-        for future in as_completed(future_to_directory):
-            try:
-                dist_path, type_path = future.result()
-                completed_directories += 1
-                percentage_completed = (completed_directories / total_directories) * 100
-                print(f"Progress: {completed_directories}/{total_directories} ({percentage_completed:.2f}%) completed")
-            except Exception as exc:
-                print(f'Directory {future_to_directory[future]} generated an exception: {exc}')
+
+    for directory, (dist_path, type_path) in map_chunked(process_directory, directories, label="dirs"):
+        pass
@@ -1,9 +1,13 @@
 import pandas as pd
 import os
+import sys
 
-# Step 1: Read specific rows from the 'summary.csv' and extract the 'taskid' column
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.results_store import read_results
+
+# Step 1: Read the energy-sorted 'taskid' column from the filtered results table
 def read_task_ids():
-    df = pd.read_csv('summary.csv')
+    df = read_results('energy_filtered.parquet', columns=['taskid'])
     total_rows = len(df)
     
     # Calculate number of entries in each group, ensuring at least 1 member
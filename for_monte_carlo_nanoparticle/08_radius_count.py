@@ -1,7 +1,10 @@
 import os
 import re
+import sys
 import csv
-import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
 
 def process_directory(directory):
     """
@@ -40,22 +43,11 @@ def process_directory(directory):
 def main():
     # Find directories in the current folder whose names match 'A' followed by digits
     all_dirs = [d for d in os.listdir('.') if os.path.isdir(d) and re.match(r'^A\d+$', d)]
-    total_dirs = len(all_dirs)
     all_results = {}
-    processed_count = 0
 
-    # Process directories concurrently using 128 workers
-    with concurrent.futures.ProcessPoolExecutor(max_workers=128) as executor:
-        future_to_dir = {executor.submit(process_directory, d): d for d in all_dirs}
-        for future in concurrent.futures.as_completed(future_to_dir):
-            directory = future_to_dir[future]
-            try:
-                id_str, result = future.result()
-                all_results[id_str] = result
-            except Exception as exc:
-                print(f"Directory {directory} generated an exception: {exc}")
-            processed_count += 1
-            print(f"Processed {processed_count}/{total_dirs} directories")
+    # Process directories in chunks on the allocated cores
+    for directory, (id_str, result) in map_chunked(process_directory, all_dirs, label="dirs"):
+        all_results[id_str] = result
 
     # Compile the set of all column names across all processed directories
     columns_set = set()
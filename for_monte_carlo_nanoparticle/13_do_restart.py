@@ -1,62 +1,84 @@
 import os
 import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.fs_ops import remove_trees
+from klmc_tools.restart_plan import (apply_restart_map, compact_ranges, format_ranges, input_taskids,
+                                     renumber_inputs, write_range_configs)
+from klmc_tools.task_scan import list_task_dirs
+
+# Usage:
+#   python3 13_do_restart.py               restart only the failed tasks, one task-farm run per contiguous range
+#   python3 13_do_restart.py --renumber    put all failed tasks in one renumbered job in restart/ (see restart_map.csv)
+#   python3 13_do_restart.py --apply-map   after that job: move restart/A<k>/ back to A<taskid>/
+sentinel = "a.xyz"
+restart_dir = "restart"
+
+if "--apply-map" in sys.argv:
+    moved = apply_restart_map(restart_dir)
+    print(f"Moved {len(moved)} restarted tasks from {restart_dir}/ back to their taskids")
+    sys.exit(0)
 
 # Step 1: Remove specific files and directories
 directories_to_remove = ["std*", "workgroup*"]
 file_to_remove = "master.log"
 
-for directory in directories_to_remove:
-    for dirpath in [d for d in os.listdir() if re.match(directory, d)]:
-        os.system(f"rm -r {dirpath}")
+entries = os.listdir()
+old_outputs = [d for directory in directories_to_remove for d in entries if re.match(directory, d)]
+# renamed away at once, deleted in the background while the restart is planned
+cleanup = remove_trees(old_outputs, background=True)
 
 if os.path.exists(file_to_remove):
     os.remove(file_to_remove)
 
 print("Step 1: ok")
 
-# Step 2: Find unfinished calculations without gulp.res
-restart_list = []
+# Step 2: Failed tasks = directories without a.xyz, plus run/A<n>.gin inputs that never started
+task_dirs = list_task_dirs(".")
+failed = [int(d[1:]) for d in task_dirs if not os.path.exists(os.path.join(d, sentinel))]
 
-for dirpath, dirnames, filenames in os.walk("."):
-    for dirname in dirnames:
-        if dirname.startswith('A') and not os.path.exists(os.path.join(dirpath, dirname, 'a.xyz')):
-            restart_list.append(os.path.join(dirpath, dirname))
+started = {int(d[1:]) for d in task_dirs}
+not_started = [n for n in input_taskids("run") if n not in started]
 
-restart_list.sort()
-
-# Output directories without gulp.res
-print("Directories without gulp.res:")
-for item in restart_list:
-    print(item)
+restart_ids = sorted(set(failed) | set(not_started))
+ranges = compact_ranges(restart_ids)
 
+print(f"Directories without {sentinel}: {len(failed)}, tasks never started: {len(not_started)}")
 with open("restart_list.txt", "w") as f:
-    for item in restart_list:
-        f.write(f"{item}\n")
-
-# Find restart number
-min_restart_num = min([int(re.search(r'A(\d+)', path).group(1)) for path in restart_list if re.search(r'A(\d+)', path)])
-max_restart_num = max([int(re.search(r'A(\d+)', path).group(1)) for path in restart_list if re.search(r'A(\d+)', path)])
-print(f"Restart from No.: {min_restart_num}")
-print(f"Restart to No.: {max_restart_num}")
+    for taskid in failed:
+        f.write(f"./A{taskid}\n")
+with open("restart_tasks.txt", "w") as f:
+    f.write("\n".join(str(taskid) for taskid in restart_ids) + "\n")
+with open("restart_ranges.txt", "w") as f:
+    for start, end in ranges:
+        f.write(f"{start} {end}\n")
+
+if not restart_ids:
+    print("No restart is needed.")
+    print(f"Step 1 cleanup: {cleanup.wait()}")
+    sys.exit(0)
+print(f"Restart tasks: {format_ranges(ranges)}")
 print("Step 2: ok")
 
-# Step 3: Remove directories from Amin_restart_num to Amax
-for num in range(min_restart_num, max_restart_num + 1):
-    dir_to_remove = os.path.join('A' + str(num))
-    if os.path.exists(dir_to_remove):
-        os.system(f"rm -r {dir_to_remove}")
-
+# Step 3: Remove the directories of the failed tasks only
+failed_dirs = [f"A{taskid}" for taskid in failed]
+print(remove_trees(failed_dirs).wait())
+print(f"Step 1 cleanup: {cleanup.wait()}")
 print("Step 3: ok")
 
-# Step 4: Prepare new files
-with open("taskfarm.config", "r") as f:
-    content = f.read()
-
-content = re.sub(r"task_start.*", f"task_start {min_restart_num}", content)
-# content = re.sub(r"task_end.*", f"task_end {max_restart_num}", content)
-
-with open("taskfarm.config", "w") as f:
-    f.write(content)
+# Step 4: Prepare the task farm
+if "--renumber" in sys.argv:
+    rows = renumber_inputs(restart_ids, job_dir=restart_dir)
+    print(f"{len(rows)} inputs renumbered into {restart_dir}/run (task_start 0, task_end {len(rows) - 1})")
+    print(f"Submit the job from {restart_dir}/, then run this script with --apply-map")
+else:
+    configs = write_range_configs("taskfarm.config", ranges)
+    print(f"{len(ranges)} task-farm run(s): taskfarm.config covers {ranges[0][0]}-{ranges[0][1]}")
+    for config, (start, end) in zip(configs[1:], ranges[1:]):
+        print(f"  then copy {config} to taskfarm.config for {start}-{end}")
+    if len(ranges) > 1:
+        print("  (or use --renumber to rerun all of them in one job)")
 
 print("Step 4: ok")
 print("...done")
@@ -1,11 +1,41 @@
 import os
-from itertools import combinations
+import re
+import sys
+import csv
+from itertools import combinations, islice
+from concurrent.futures import ThreadPoolExecutor
 
-def generate_all_combinations(input_filepath):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.restart_plan import set_task_range
+from klmc_tools.symmetry import cubic_operations, site_permutations, stabilizer, unique_combinations
+
+# Usage:
+#   python 00_combination_dopants.py          one input per symmetry-unique combination
+#   python 00_combination_dopants.py --all    every combination (no symmetry reduction)
+#
+# run/combinations.csv lists taskid, the chosen data lines and the multiplicity
+# (number of equivalent combinations) of each input.
+
+n_dopants = 4
+max_threads = 16
+write_batch = 1024
+
+def parse_cart(line):
+    # 'vacancy cart x y z' / 'impurity Gd cart x y z' / 'centre cart x y z'
+    fields = line.split()
+    i = fields.index("cart")
+    return [float(x) for x in fields[i + 1:i + 4]]
+
+def write_input(task):
+    filename, lines = task
+    with open(filename, 'w') as new_file:
+        new_file.writelines(lines)
+
+def generate_all_combinations(input_filepath, use_symmetry=True):
     # Read the input file
     with open(input_filepath, 'r') as file:
         lines = file.readlines()
-    
+
     # Data lines are lines 22 to 43
     data_lines = lines[21:43]
 
@@ -16,24 +46,52 @@ def generate_all_combinations(input_filepath):
     # Get current working directory
     current_directory = os.getcwd()
     output_folder = os.path.join(current_directory, 'run')
-    
+
     # Ensure the output directory exists
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # Generate files for each combination of 3 data lines
-    all_combinations = list(combinations(data_lines, 4))
-    print(f"Total combinations: {len(all_combinations)}")
-    
-    # Generate each new .gin file
-    for i, combination in enumerate(all_combinations):
-        filename = os.path.join(output_folder, f"A{i}.gin")
-        print(i)
-        
-        # Write the parts before, selected lines, and parts after to a new file
-        with open(filename, 'w') as new_file:
-            new_file.writelines(part_before + list(combination) + part_after)
+    if use_symmetry:
+        # point group of the defect centre (cubic fluorite site: Oh), reduced to the
+        # operations that keep the vacancies in place, acting on the candidate sites
+        centre = next((parse_cart(line) for line in part_before if line.split()[:1] == ["centre"]), [0.0, 0.0, 0.0])
+        shift = lambda xyz: [x - c for x, c in zip(xyz, centre)]
+        vacancies = [shift(parse_cart(line)) for line in part_before if re.match(r"^\s*vacancy\s", line)]
+        sites = [shift(parse_cart(line)) for line in data_lines]
+        ops = stabilizer(cubic_operations(), vacancies)
+        perms = site_permutations(ops, sites)
+        print(f"Point group operations keeping the vacancies: {len(ops)} ({len(perms)} distinct on the sites)")
+        selections = unique_combinations(len(data_lines), n_dopants, perms)
+    else:
+        selections = ((combo, 1) for combo in combinations(range(len(data_lines)), n_dopants))
+
+    # Generate each new .gin file, a batch at a time
+    count = 0
+    total = 0
+    with open(os.path.join(output_folder, 'combinations.csv'), 'w', newline='') as f, \
+            ThreadPoolExecutor(max_workers=max_threads) as executor:
+        writer = csv.writer(f)
+        writer.writerow(["taskid", "lines", "multiplicity"])
+        while True:
+            batch = list(islice(selections, write_batch))
+            if not batch:
+                break
+            tasks = []
+            for combo, multiplicity in batch:
+                filename = os.path.join(output_folder, f"A{count}.gin")
+                tasks.append((filename, part_before + [data_lines[i] for i in combo] + part_after))
+                # 1-based line numbers in the input file
+                writer.writerow([count, " ".join(str(22 + i) for i in combo), multiplicity])
+                count += 1
+                total += multiplicity
+            list(executor.map(write_input, tasks))
+            print(f"written {count} inputs")
+
+    print(f"Total combinations: {total}, inputs written: {count}")
+    if count and os.path.exists('taskfarm.config'):
+        set_task_range('taskfarm.config', 0, count - 1)
+        print(f"taskfarm.config: task_start 0 / task_end {count - 1}")
 
 # Example usage
 input_filepath = 'defect.gin'  # Update this path to the location of your defect.gin file
-generate_all_combinations(input_filepath)
+generate_all_combinations(input_filepath, use_symmetry="--all" not in sys.argv)
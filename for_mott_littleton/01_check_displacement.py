@@ -1,9 +1,10 @@
 import pandas as pd
 import os
-from concurrent.futures import ProcessPoolExecutor
-import concurrent.futures
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+
 def process_file(filepath):
     max_differences = []
     with open(filepath, 'r') as file:
@@ -19,7 +20,7 @@ def process_file(filepath):
     
     return max(max_differences, key=abs) if max_differences else None
 
-def process_all_folders_concurrently(root_directory, max_workers=128):
+def process_all_folders_concurrently(root_directory, max_workers=None):
     paths = []
     for root, dirs, files in os.walk(root_directory):
         for file in files:
@@ -30,15 +31,10 @@ def process_all_folders_concurrently(root_directory, max_workers=128):
     print(f"Total files to process: {total_files}")
 
     results = []
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(process_file, path): path for path in paths}
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result is not None:
-                directory_name = os.path.basename(os.path.dirname(futures[future]))
-                results.append((directory_name, result))
-            done = len(results)
-            print(f"Progress: {done}/{total_files} files processed ({done / total_files * 100:.2f}%)")
+    for path, result in map_chunked(process_file, paths, max_workers=max_workers, label="files"):
+        if result is not None:
+            directory_name = os.path.basename(os.path.dirname(path))
+            results.append((directory_name, result))
     
     # Create a single CSV with all results
     df = pd.DataFrame(results, columns=['Directory', 'Max_Displacement'])
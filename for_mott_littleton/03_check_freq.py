@@ -1,9 +1,12 @@
 import os
+import sys
 import glob
-from concurrent.futures import ProcessPoolExecutor, as_completed
 import re
 import shutil
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.executor import map_chunked
+
 def check_frequency(folder):
     try:
         filename = os.path.join(folder, 'gulp_klmc.gout')
@@ -32,20 +35,12 @@ def check_frequency(folder):
 def main():
     # List all folders starting with 'A' followed by any number
     folders = glob.glob('A*')
-    n_folders = len(folders)
     results = []
-    completed = 0
     
-    # Use 64 parallel workers
-    with ProcessPoolExecutor(max_workers=64) as executor:
-        future_to_folder = {executor.submit(check_frequency, folder): folder for folder in folders}
-        
-        for future in as_completed(future_to_folder):
-            result = future.result()
-            if result:
-                results.append(result)
-            completed += 1
-            print(f"Progress: {completed}/{n_folders} folders checked ({(completed/n_folders)*100:.2f}%)")
+    # Chunks of folders on the allocated cores
+    for folder, result in map_chunked(check_frequency, folders, label="folders"):
+        if result:
+            results.append(result)
     
     # Write folders needing restart to a file
     with open('need_restart.txt', 'w') as f:
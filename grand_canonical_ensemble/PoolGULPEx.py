@@ -5,6 +5,10 @@ from concurrent.futures import ProcessPoolExecutor
 import os,sys
 import pandas as pd
 
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.extract_cache import ExtractCache
+from klmc_tools.results_store import write_results
+
 def get_avg_potentials(gpath):
     # Initialize lists to store potential values for each atom type
     potentials_la = []
@@ -139,6 +143,7 @@ def get_gulp_output(fname,__gtol):
 if __name__ == '__main__':
 
 	_MAX_ITEM = 19195
+	_CACHE_VERSION = 'ExtractGULP-1'		# bump when 'get_gulp_output' / 'get_avg_potentials' change
 
 	dir_path = os.getcwd()	#sys.argv[1]	# only req input parameter -> summary directory path abs
 	#dir_path = sys.argv[1]	# only req input parameter -> summary directory path abs
@@ -238,17 +243,29 @@ if __name__ == '__main__':
 		else:
 			return None
 
-	results = []
+	# reuse extractions from a previous run unless the .gout changed since
+	gpath_to_id = { os.path.join(dir_path,'A'+str(file_id),'gulp_klmc.gout') : file_id for file_id in range(_MAX_ITEM) }
+	cache = ExtractCache(os.path.join(dir_path,'.poolgulpex_cache.sqlite'),_CACHE_VERSION)
+	cached, stale = cache.partition(gpath_to_id)
+	print(f"Reusing {len(cached)} cached extractions, parsing {len(stale)} new or changed outputs.")
+
+	results = [ res for res in cached.values() if res ]
+	fresh = []
 	with ProcessPoolExecutor(max_workers=32) as executor:
 		#results = list(executor.map(process_file,range(_MAX_ITEM)))
 		#print(f"Processed {len(results)} out of {_MAX_ITEM} directories ({len(results) / _MAX_ITEM * 100:.2f}% complete).")
 
-		for result in executor.map(process_file,range(_MAX_ITEM)):		# execute 'process_file'
+		stale_ids = [ gpath_to_id[gpath] for gpath,key in stale ]
+		for (gpath,key),result in zip(stale,executor.map(process_file,stale_ids)):		# execute 'process_file'
+			fresh.append((gpath,key,result))
 			if result:	# if result != None
 				results.append(result)
 				print(f"Processed {len(results)} out of {_MAX_ITEM} directories ({len(results) / _MAX_ITEM * 100:.2f}% complete).")
 				#print(result)
 
+	cache.store(fresh)
+	cache.close()
+
 	results = [res for res in results if res is not None]
 
 	df = pd.DataFrame(results)
@@ -256,7 +273,11 @@ if __name__ == '__main__':
 	df.set_index('energy',inplace=True)
 	df = df.sort_values(by='energy',ascending=True)
 
-	df.to_csv(sys.argv[1])
+	# .parquet / .feather outputs are written as typed columnar tables
+	if os.path.splitext(sys.argv[1])[1] in ('.parquet','.feather'):
+		write_results(df.reset_index(),sys.argv[1])
+	else:
+		df.to_csv(sys.argv[1])
 
 	print(df)
 
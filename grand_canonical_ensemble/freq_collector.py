@@ -3,10 +3,23 @@
 import sys,os
 import numpy as np
 import pandas as pd
-import pickle
 
 from concurrent.futures import ProcessPoolExecutor
 
+from freq_store import FreqStore
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.gout_parser import parse_gout, SECTION_HANDLERS
+
+# frequency source : 'auto' (freq.txt if present, else gulp_klmc.gout) / 'txt' / 'gout'
+try:
+	_freq_source = sys.argv[1]
+except IndexError:
+	_freq_source = 'auto'
+
+_chunk = 256		# A{taskid} directories per worker task
+_freq_handlers = { 'Frequencies (cm-1)' : SECTION_HANDLERS['Frequencies (cm-1)'] }
+
 '''
 	read-in files
 '''
@@ -45,20 +58,39 @@ freqlist = []		# include 'dict'(s) of GULP calculation frequencies
 
 
 
-def task_process(arg):
+def read_freqs(task_dir):
 
 	'''
-		processing frequencies
-		given taskid, read file and return taskid and frequencies
+		gamma point frequencies of one A{taskid} directory as a float64 array
+		freq.txt : one value per line / gulp_klmc.gout : 'Frequencies (cm-1)' block
 	'''
-	taskid, file_path = arg
+	freq_txt = os.path.join(task_dir,'freq.txt')
+	if _freq_source != 'gout' and os.path.exists(freq_txt):
+		return np.loadtxt(freq_txt,dtype=np.float64,ndmin=1)
+	if _freq_source != 'txt':
+		record = parse_gout(os.path.join(task_dir,'gulp_klmc.gout'),handlers=_freq_handlers)
+		if record.frequencies:
+			return np.array(record.frequencies,dtype=np.float64)
+	raise FileNotFoundError(f'no frequencies found in {task_dir}')
+
+def chunk_process(args):
 
+	'''
+		processing frequencies of a chunk of directories
+		returns packed (taskids, lengths, freqs) arrays - one pickle per chunk, not per taskid
+	'''
+	taskids = []
 	freqlist = []
-	with open(file_path,'r') as f:
-		for line in f:
-			freqlist.append(float(line.strip()))
+	for taskid, task_dir in args:
+		try:
+			freqlist.append(read_freqs(task_dir))
+			taskids.append(taskid)
+		except (OSError, ValueError) as e:
+			print(f'skipping taskid {taskid} : {e}',file=sys.stderr)
 
-	return taskid, freqlist
+	lengths = np.array([ len(f) for f in freqlist ],dtype=np.int64)
+	freqs = np.concatenate(freqlist) if freqlist else np.zeros(0)
+	return np.array(taskids,dtype=np.int64), lengths, freqs
 
 for csvfile,s in zip(csvlist,size):
 	df = pd.read_csv(csvfile)
@@ -75,29 +107,27 @@ for csvfile,s in zip(csvlist,size):
 	#
 	#if s != 0:	# s : size
 	if True:
-		freq_summary = {}	# save this into 'pkl'
-
-		print(f'writing pkl for the size = {s} ...')
+		print(f'writing frequency store for the size = {s} ...')
 
 		# get taskid list
 		taskid_list = df['taskid'].tolist()
 		print(taskid_list)
 		# sys.exit()
 
-		# taskid_path map object generation
-		taskid_path_map = [] 
-		for taskid in taskid_list:
-			gulp_output_path = os.path.join(freq_file_root[s],f'A{taskid}')
-			gulp_output_freq_path = os.path.join(gulp_output_path,'freq.txt')
+		# taskid / A{taskid} directory chunks for the PoolExecutor
+		taskid_dir_map = [ (taskid,os.path.join(freq_file_root[s],f'A{taskid}')) for taskid in taskid_list ]
+		chunks = [ taskid_dir_map[i:i+_chunk] for i in range(0,len(taskid_dir_map),_chunk) ]
 
-			taskid_path_map.append((taskid,gulp_output_freq_path))	# set map fpr PoolExecutor	- input 'taskid'/'freq.txt file path'
-
-		# dict
-		freq_summary = {}
+		# packed store : one float64 array + offsets + taskids
+		taskids = []
+		lengths = []
+		freqs = []
 		with ProcessPoolExecutor(max_workers=32) as executor:
-			for result in executor.map(task_process,taskid_path_map):
-				freq_summary[result[0]] = result[1]
-				# result[0] = taskid, result[1] = frequency_list
-
-		with open(f'freq{s}.pkl','wb') as f:
-			pickle.dump(freq_summary,f)
+			for chunk_taskids, chunk_lengths, chunk_freqs in executor.map(chunk_process,chunks):
+				taskids.append(chunk_taskids)
+				lengths.append(chunk_lengths)
+				freqs.append(chunk_freqs)
+
+		store = FreqStore.from_packed(taskids,lengths,freqs)
+		store.save(f'freq{s}.npz')
+		print(f' | {len(store)}/{len(taskid_list)} structures written to freq{s}.npz')
@@ -0,0 +1,106 @@
+#!/bin/python
+
+'''
+	packed gamma point frequency store
+
+	all frequencies of one size live in one contiguous float64 array
+		freqs   : (total modes,)	cm-1
+		offsets : (N+1,)			structure i -> freqs[offsets[i]:offsets[i+1]]
+		taskids : (N,)				row -> taskid
+	saved as an uncompressed .npz, replacing the freq{s}.pkl dict of float lists
+
+	store = FreqStore.load('freq_pkl/freq3.npz')
+	store[taskid]                     -> frequencies of one structure (array view)
+	store.matrix(taskids,skip=3)      -> NaN padded (structures x modes) matrix
+'''
+
+import os
+import pickle
+import numpy as np
+
+
+class FreqStore:
+
+	def __init__(self,freqs,offsets,taskids):
+
+		self.freqs   = np.asarray(freqs,dtype=np.float64)
+		self.offsets = np.asarray(offsets,dtype=np.int64)
+		self.taskids = np.asarray(taskids,dtype=np.int64)
+		# taskid -> row by binary search, no per taskid python dict
+		self._order  = np.argsort(self.taskids,kind='stable')
+		self._sorted = self.taskids[self._order]
+
+	@classmethod
+	def from_packed(cls,taskids,lengths,freqs):
+		'''
+			taskids / per structure mode counts / all frequencies back to back
+			each may also be a list of such chunks (one per worker task)
+		'''
+		if isinstance(taskids,list):
+			taskids = np.concatenate(taskids) if taskids else np.zeros(0,dtype=np.int64)
+			lengths = np.concatenate(lengths) if lengths else np.zeros(0,dtype=np.int64)
+			freqs   = np.concatenate(freqs) if freqs else np.zeros(0,dtype=np.float64)
+		offsets = np.zeros(len(lengths)+1,dtype=np.int64)
+		np.cumsum(lengths,out=offsets[1:])
+		return cls(freqs,offsets,taskids)
+
+	@classmethod
+	def from_lists(cls,taskids,freqlists):
+		lengths = np.array([ len(f) for f in freqlists ],dtype=np.int64)
+		freqs = np.concatenate([ np.asarray(f,dtype=np.float64) for f in freqlists ]) if len(freqlists) else np.zeros(0)
+		return cls.from_packed(np.asarray(taskids,dtype=np.int64),lengths,freqs)
+
+	@classmethod
+	def from_dict(cls,freq_summary):
+		# legacy pkl layout : { taskid : [freq, ...] }
+		return cls.from_lists(list(freq_summary.keys()),list(freq_summary.values()))
+
+	@classmethod
+	def load(cls,path):
+		'''
+			.npz store, or a legacy freq{s}.pkl dict
+		'''
+		if os.path.splitext(path)[1] == '.pkl':
+			with open(path,'rb') as f:
+				return cls.from_dict(pickle.load(f))
+		with np.load(path) as data:
+			return cls(data['freqs'],data['offsets'],data['taskids'])
+
+	def save(self,path):
+		np.savez(path,freqs=self.freqs,offsets=self.offsets,taskids=self.taskids)
+
+	def __len__(self):
+		return len(self.taskids)
+
+	def __contains__(self,taskid):
+		i = np.searchsorted(self._sorted,taskid)
+		return bool(i < len(self._sorted) and self._sorted[i] == taskid)
+
+	def rows(self,taskids):
+		taskids = np.asarray(taskids,dtype=np.int64)
+		i = np.searchsorted(self._sorted,taskids)
+		found = i < len(self._sorted)
+		found[found] = self._sorted[i[found]] == taskids[found]
+		if not np.all(found):
+			raise KeyError(f'taskid not in frequency store : {taskids[~found][:10].tolist()}')
+		return self._order[i]
+
+	def __getitem__(self,taskid):
+		r = self.rows([taskid])[0]
+		return self.freqs[self.offsets[r]:self.offsets[r+1]]
+
+	def matrix(self,taskids=None,skip=0):
+		'''
+			NaN padded (structures x modes) matrix for 'taskids' (all rows if None)
+			skip : leading modes left out of every structure (3 translations)
+		'''
+		rows = np.arange(len(self.taskids)) if taskids is None else self.rows(taskids)
+		start = self.offsets[rows] + skip
+		length = np.maximum(self.offsets[rows+1] - start,0)
+		M = int(length.max()) if len(length) else 0
+
+		mat = np.full((len(rows),M),np.nan,dtype=np.float64)
+		r = np.repeat(np.arange(len(rows)),length)
+		c = np.arange(int(length.sum())) - np.repeat(np.cumsum(length) - length,length)
+		mat[r,c] = self.freqs[np.repeat(start,length) + c]
+		return mat
@@ -0,0 +1,196 @@
+#!/bin/python
+
+'''
+	grand canonical ensemble engine
+
+	works on whole arrays in log space (log-sum-exp), so nothing overflows and
+	there is no float128 scalar loop
+
+	shapes
+		S : compositions (sizes)		x    (S,)
+		N : structures of one size		E    (N,)
+		U : chemical potentials			u    (U,)
+		T : temperatures				T    scalar or (nT,)
+
+	every function broadcasts over a leading temperature axis when T is an array
+'''
+
+import numpy as np
+
+# constants ----
+_kb = 8.617333262e-5			# eV/K
+_wavenumber_to_ev = 1.239841984332e-4	# cm-1 -> eV
+
+_vib_chunk = 1 << 24			# max elements of the (T,N,M) work array in harmonic_free_energy
+
+
+def logsumexp(a,axis=-1):
+
+	amax = np.max(a,axis=axis,keepdims=True)
+	amax = np.where(np.isfinite(amax),amax,0.)
+	ret = np.log(np.sum(np.exp(a - amax),axis=axis)) + np.squeeze(amax,axis=axis)
+	return ret
+
+def _beta(T,extra_axes=0):
+	# 1/kT shaped to broadcast against trailing axes
+	beta = 1./(_kb*np.asarray(T,dtype=np.float64))
+	return beta.reshape(beta.shape + (1,)*extra_axes)
+
+def log_z(E,T):
+	'''
+		canonical log Z = log sum_i exp(-E_i/kT)
+		E : (N,) or (nT,N) energies (eV) ... (nT,N) when E carries T dependent terms
+		returns scalar or (nT,)
+	'''
+	E = np.asarray(E,dtype=np.float64)
+	return logsumexp(-E*_beta(T,1),axis=-1)
+
+def free_energy(lnZ,T):
+	'''
+		G = -kT log Z
+	'''
+	lnZ = np.asarray(lnZ,dtype=np.float64)
+	return -lnZ/_beta(T,lnZ.ndim - np.ndim(T))
+
+#
+# harmonic vibrations
+#
+def harmonic_free_energy(freq,T,thermal=True):
+	'''
+		F_vib = sum_modes [ hv/2 + kT ln(1 - exp(-hv/kT)) ] for every structure
+		freq : (N,M) cm-1, NaN padded ... modes <= 0 (and padding) are masked out
+		thermal=False gives the ZPE term only
+		returns (N,) or (nT,N)
+	'''
+	hv = np.asarray(freq,dtype=np.float64)*_wavenumber_to_ev
+	valid = hv > 0.			# NaN compares False
+	hv = np.where(valid,hv,0.)
+	zpe = 0.5*np.sum(hv,axis=-1)
+
+	T = np.asarray(T,dtype=np.float64)
+	if not thermal:
+		return np.broadcast_to(zpe,T.shape + zpe.shape).copy()
+
+	Tflat = T.reshape(-1)
+	F = np.empty((len(Tflat),) + zpe.shape,dtype=np.float64)
+	step = max(1,_vib_chunk//max(hv.size,1))
+	for b in range(0,len(Tflat),step):
+		beta = 1./(_kb*Tflat[b:b+step,None,None])
+		with np.errstate(divide='ignore',invalid='ignore'):
+			lnq = np.where(valid,np.log1p(-np.exp(-hv*beta)),0.)
+		F[b:b+step] = zpe + np.sum(lnq,axis=-1)/beta[...,0]
+	return F.reshape(T.shape + zpe.shape)
+
+def _grand_exponent(x,lnZ,u,T):
+	# a[..., u, s] = x_s u / kT + log Z_s
+	x = np.asarray(x,dtype=np.float64)
+	u = np.asarray(u,dtype=np.float64)
+	lnZ = np.asarray(lnZ,dtype=np.float64)
+	return u[...,:,None]*x*_beta(T,2) + lnZ[...,None,:]
+
+def weights_x(x,lnZ,u,T):
+	'''
+		w_x(u) = exp(x u/kT) Z_x / sum_x' exp(x' u/kT) Z_x'
+		x : (S,) / lnZ : (S,) or (nT,S) / u : (U,) or (nT,U)
+		returns (U,S) or (nT,U,S)
+	'''
+	a = _grand_exponent(x,lnZ,u,T)
+	a = a - np.max(a,axis=-1,keepdims=True)
+	w = np.exp(a)
+	return w/np.sum(w,axis=-1,keepdims=True)
+
+def expect_x(x,lnZ,u,T):
+	'''
+		<x>(u) for the whole u grid as one matrix product
+		returns (U,) or (nT,U)
+	'''
+	return weights_x(x,lnZ,u,T) @ np.asarray(x,dtype=np.float64)
+
+def grand_potential(x,lnZ,u,T):
+	'''
+		Omega(u) = -kT log sum_x exp(x u/kT) Z_x
+		returns (U,) or (nT,U)
+	'''
+	a = _grand_exponent(x,lnZ,u,T)
+	return -logsumexp(a,axis=-1)/_beta(T,1)
+
+#
+# inverting <x>(u) ---> u(<x>)
+#
+# <x>(u) is monotone non-decreasing (d<x>/du = var(x)/kT), so the inverse is a
+# sorted search plus a monotone cubic (PCHIP, Fritsch-Carlson) through (<x>,u)
+#
+def _pchip_slopes(x,y):
+
+	h = np.diff(x)
+	d = np.diff(y)/h
+	m = np.zeros_like(y)
+	if len(x) == 2:
+		m[:] = d[0]
+		return m
+
+	# interior : weighted harmonic mean, zero at local extrema
+	w1 = 2.*h[1:] + h[:-1]
+	w2 = h[1:] + 2.*h[:-1]
+	same = (d[:-1]*d[1:]) > 0.
+	with np.errstate(divide='ignore',invalid='ignore'):
+		hm = (w1 + w2)/(w1/d[:-1] + w2/d[1:])
+	m[1:-1] = np.where(same,hm,0.)
+
+	# end points : one-sided three point estimate, kept shape preserving
+	for i,(h0,h1,d0,d1) in ((0,(h[0],h[1],d[0],d[1])),(-1,(h[-1],h[-2],d[-1],d[-2]))):
+		me = ((2.*h0 + h1)*d0 - h0*d1)/(h0 + h1)
+		if np.sign(me) != np.sign(d0):
+			me = 0.
+		elif np.sign(d0) != np.sign(d1) and abs(me) > abs(3.*d0):
+			me = 3.*d0
+		m[i] = me
+	return m
+
+def pchip(x,y,xq):
+	'''
+		monotone cubic interpolation of y(x) at xq ... x strictly increasing
+		xq outside [x0,xn] is clamped to the end values
+	'''
+	x  = np.asarray(x,dtype=np.float64)
+	y  = np.asarray(y,dtype=np.float64)
+	xq = np.clip(np.asarray(xq,dtype=np.float64),x[0],x[-1])
+	m  = _pchip_slopes(x,y)
+
+	i = np.clip(np.searchsorted(x,xq,side='right') - 1,0,len(x) - 2)
+	h = x[i+1] - x[i]
+	t = (xq - x[i])/h
+	t2 = t*t
+	t3 = t2*t
+	return (2.*t3 - 3.*t2 + 1.)*y[i] + (t3 - 2.*t2 + t)*h*m[i] + (-2.*t3 + 3.*t2)*y[i+1] + (t3 - t2)*h*m[i+1]
+
+def invert_x(xq,ex,u,tol=1e-12):
+	'''
+		u(<x>) at xq from a tabulated <x>(u) ... ex, u : (U,) with u increasing
+		flat stretches (<x> saturated at 0 or 1) keep their first u
+		<x> flat over the whole grid : every xq gets that single u (widen the u range)
+	'''
+	ex = np.maximum.accumulate(np.asarray(ex,dtype=np.float64))		# round-off guard
+	u  = np.asarray(u,dtype=np.float64)
+	keep = np.concatenate(([True],np.diff(ex) > tol))
+	if keep.sum() < 2:
+		return np.full(np.shape(xq),u[0])
+	return pchip(ex[keep],u[keep],xq)
+
+def refine_u(x,lnZ,u,T,dx_max=2e-3,max_iter=12):
+	'''
+		adaptive u grid : bisect every interval where <x> jumps by more than dx_max
+		(plateaus of the voltage curve), only new points are evaluated
+		T scalar ... returns refined (u, <x>(u))
+	'''
+	u  = np.asarray(u,dtype=np.float64)
+	ex = expect_x(x,lnZ,u,T)
+	for _ in range(max_iter):
+		wide = np.flatnonzero(np.diff(ex) > dx_max)
+		if len(wide) == 0:
+			break
+		umid = 0.5*(u[wide] + u[wide+1])
+		exmid = expect_x(x,lnZ,umid,T)
+		u  = np.insert(u,wide+1,umid)
+		ex = np.insert(ex,wide+1,exmid)
+	return u,ex
@@ -1,16 +1,21 @@
 #!/bin/python
 
-import pickle
+import os
 import sys
 
+from freq_store import FreqStore
+
 size = sys.argv[1]
 taskid = int(sys.argv[2])
 
-with open(f'freq{size}.pkl','rb') as f:
-	freq_pkl = pickle.load(f)
+# packed store, or the older pickle dict
+fname = f'freq{size}.npz'
+if not os.path.exists(fname):
+	fname = f'freq{size}.pkl'
+freq_store = FreqStore.load(fname)
 
 # size 1 taskid 123
-for freqs in freq_pkl[taskid]:
+for freqs in freq_store[taskid]:
 	print(freqs)
 
-print(f'length : {len(freq_pkl)}')
+print(f'length : {len(freq_store)}')
@@ -5,126 +5,36 @@ import pandas as pd
 import numpy as np
 import pickle
 
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.results_store import read_results
+import gc_engine as gc
+from freq_store import FreqStore
+
 # from concurrent.futures import ProcessPoolExecutor
 
 # constants ----
-_wavenumber_to_ev = np.float128(1.239841984332e-4)
-_kb = np.float128(8.617333262e-5)
+_wavenumber_to_ev = gc._wavenumber_to_ev
+_kb = gc._kb
 
 #
 # internal use functions 	-----------------------------------------------------
 #
-def expkbt(E,T):
-
-	global _kb
-	#E = np.float128(E)
-	#T = np.float128(T)
-
-	#try:
-	#	ret = np.exp(-E/T/_kb)
-	#except OverflowError:
-	#	if -E/T/_kb > 500:
-	#		ret = np.exp(500.)
-
-	ret = np.exp(-E/T/_kb)
-	return ret
-		
-def get_gz(csvdf,T,vib=False,pkldf=None):
-
-	global _kb
-	global _wavenumber_to_ev
-	#u = np.float128(0.)	# _corr
-
-	Elist = csvdf['energy'].values
-	Egm = np.float128(Elist[0])		# global minimum
-
-	T = np.float128(T)
-	Z = np.float128(0.)
-	G = np.float128(0.)
-
-	if vib == False:
-
-		for E in Elist:
-			E = np.float128(E) - Egm
-			Z += expkbt(E,T)
-		
-		Z = np.exp(-Egm/_kb/T) * Z	
-		G = - _kb * T * np.log(Z)
-		#print(Egm,-Egm/_kb/T,np.exp(-Egm/_kb/T),Z,G)
+def get_gz(csvdf,T,vib=False,freqmat=None,thermal=True):
+	'''
+		canonical G / log Z of one size - one log-sum-exp over all structures
+		(log Z instead of Z, so nothing overflows and no float128 is needed)
+	'''
+	Elist = csvdf['energy'].values.astype(np.float64)
 	#
-	# include vibrational contributions
+	# include vibrational contributions - harmonic F_vib (ZPE + thermal) of every structure at once
 	#
-	elif vib == True:
-		#
-		# looping thru structures / distinguished by 'taskid'
-		#
-		for E,taskid in zip(Elist,csvdf['taskid'].values):
-
-			E = np.float128(E) - Egm
-			ZE = expkbt(E,T)
-
-			#
-			# get freq info for this struct
-			#
-			freqlist = np.array(pkldf[taskid],dtype=np.float128)
-			# add ZPE contribution - gamma point ?
-			freq0_power = np.float128(0.)
-			for freq in freqlist:
-				freq0_power += (0.5 * freq * _wavenumber_to_ev)	
-			Zvib0 = np.exp(-freq0_power/_kb/T)
-	
-			# add all vib contribution
-			# NotImplemented
-
-			# sum up
-			Z += (ZE * Zvib0)
-
-		# pull back Egm
-		Z = np.exp(-Egm/_kb/T) * Z
-		G = - _kb * T * np.log(Z)
-
-	return np.float128(G),np.float128(Z)
-
-# issue -> overflow	 ---------------------------
-def get_grandZ(npZlist,npxlist,u,T):
-	
-	global _kb
-	Zg = np.float128(0.)
-	u = np.float128(u)
-	T = np.float128(T)
-
-	for Z,x in zip(npZlist,npxlist):
-		Zg = Zg + np.exp(x*u/_kb/T) * Z
-	
-	return Zg # causing overflow
-# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^ issue -> overflow
-
-def get_wx(npZlist,npxlist,u,T):
-
-	global _kb
-	
-	u = np.float128(u)
-	wxlist = []	# return tmp
-
-	for Z,x in zip(npZlist,npxlist):
-		
-		Zg = np.float128(0.)
-		for Zp,xp in zip(npZlist,npxlist):
-			Zg = Zg + np.exp((xp-x)*u/_kb/T) * Zp
-
-		wx = Z/Zg
-		wxlist.append(wx)
-
-	return np.array(wxlist,dtype=np.float128)	# final type np.float128 numpy array
-
-
-def get_expect_x(npxlist,npwxlist):
-
-	expect_x = np.float128(0.)
-	for x,wx in zip(npxlist,npwxlist):
-		expect_x = expect_x + x*wx
-	return expect_x
+	if vib == True:
+		# 'frow' : row of this structure in the size's frequency matrix
+		Fvib = gc.harmonic_free_energy(freqmat[csvdf['frow'].values],T,thermal=thermal)
+		Elist = Elist + Fvib		# (N,) or (nT,N)
 
+	lnZ = gc.log_z(Elist,T)
+	return gc.free_energy(lnZ,T),lnZ
 
 #
 # inverting function <x>(u) ---> u(<x>)
@@ -133,37 +43,90 @@ def get_u_by_x(x,xlist,ulist):
 	if len(xlist) != len(ulist):
 		print(f'Err, xlist / ulist length are different ... something is wrong')
 		sys.exit(1)
-	if x < 0.0001 or x > 1.0:
+	if np.min(x) < 0.0001 or np.max(x) > 1.0:
 		print(f'Err, x value must be in range [0.0001:1.0000]')
 		sys.exit(1)
-	# closest index (ci)
-	ci = min(range(len(xlist)), key=lambda i: abs(xlist[i] - x))
-	return ulist[ci]
+	if np.ptp(xlist) <= 1e-12:
+		print(f'Warning, <x>(u) is flat over the u grid ... u(<x>) is a single value, widen the u range')
+	# <x>(u) is monotone : sorted search + monotone cubic between the grid points
+	return gc.invert_x(x,xlist,ulist)
 
-def get_grand_pot(x_eval,T,npxlist,npZlist,expect_xlist,ulist):
+def get_grand_pot(x_eval,T,npxlist,nplnZlist,expect_xlist,ulist):
 
-	# x : pure input <x>
+	# x_eval : <x> values to evaluate (array)
 	# T : pure input
 	
-	# Zclist : Z canonical
-	# xlist  : known x values
+	# nplnZlist : log Z canonical
+	# npxlist   : known x values
 	# exlist / ulist for calculating chemical potential u(<x>)
-	
-	x_eval = np.float128(x_eval)
-	T      = np.float128(T)
-	#npexpect_xlist = np.array(expect_xlist,dtype=np.float128)
-	#npulist = np.array(ulist,dtype=np.float128)
 
-	global _kb
+	u  = get_u_by_x(x_eval,expect_xlist,ulist)
+	gp = gc.grand_potential(npxlist,nplnZlist,u,T)
 	
-	gp = np.float128(0.)
-	
-	for x,Z in zip(npxlist,npZlist):
-		gp += np.exp(x*get_u_by_x(x_eval,expect_xlist,ulist)/_kb/T) * Z
-	
-	gp = -_kb*T*np.log(gp)
-	
-	return x_eval, gp, get_u_by_x(x_eval,expect_xlist,ulist)
+	return x_eval, gp, u
+
+#
+# temperature sweep	-----------------------------------------------------------------------
+#
+_T_batch = 16		# temperatures per batched <x>(u) evaluation ... (batch,U,S) work array
+
+def get_temperatures(arg):
+	'''
+		'300'           -> single T
+		'100:1000:50'   -> Tmin:Tmax:dT grid (Tmax included)
+		'300,600,900'   -> explicit list
+	'''
+	if ':' in arg:
+		Tmin,Tmax,dT = [ float(t) for t in arg.split(':') ]
+		return np.arange(Tmin,Tmax+0.5*dT,dT)
+	return np.array([ float(t) for t in arg.split(',') ])
+
+def run_sweep(Tlist,csvlist,pkllist,npxlist,npulist,npixlist,vib=False,thermal=True,refine=False):
+	'''
+		energies / frequencies are loaded once, G(x) / <x>(u) / grand potential
+		are evaluated for the whole T grid, T batch by T batch
+	'''
+	nT = len(Tlist)
+	npGlist   = np.zeros((len(csvlist),nT),dtype=np.float64)
+	nplnZlist = np.zeros((len(csvlist),nT),dtype=np.float64)
+
+	for s, (csvdf,freqmat) in enumerate(zip(csvlist,pkllist)):
+		print(f' * processing partition function Z : size {s} | {nT} temperatures')
+		npGlist[s],nplnZlist[s] = get_gz(csvdf,Tlist,vib=vib,freqmat=freqmat,thermal=thermal)
+
+	nplnZlist = nplnZlist.T		# (nT,S)
+
+	prefix = 'vvib' if vib else 'vib'
+	tag = f'{Tlist[0]}-{Tlist[-1]}'
+
+	fname = f'{prefix}_Gx_sweep_T{tag}.out'
+	with open(fname,'w') as f:
+		f.write(f'T, x, G, Ecorr={_corr}\n')
+		for t,T in enumerate(Tlist):
+			for x,G in zip(npxlist,npGlist[:,t]):
+				f.write(f'{T}, {x}, {G}\n')
+
+	fname = f'{prefix}_sweep_T{tag}_all.out'
+	with open(fname,'w') as f:
+		f.write('T, x_LiConc, GrandPotential, u, -u\n')
+		for b in range(0,nT,_T_batch):
+			Tb = Tlist[b:b+_T_batch]
+			lnZb = nplnZlist[b:b+_T_batch]
+			if refine:
+				# refined u grids differ per temperature
+				ueval = []
+				for T,lnZ in zip(Tb,lnZb):
+					uref,exref = gc.refine_u(npxlist,lnZ,npulist,T)
+					ueval.append(get_u_by_x(npixlist,exref,uref))
+				ueval = np.array(ueval)
+			else:
+				expect_xlist = gc.expect_x(npxlist,lnZb,npulist,Tb)		# (batch,U)
+				ueval = np.array([ get_u_by_x(npixlist,ex,npulist) for ex in expect_xlist ])	# (batch,X)
+			gplist = gc.grand_potential(npxlist,lnZb,ueval,Tb)		# (batch,X)
+			for T,gp,u in zip(Tb,gplist,ueval):
+				for row in zip(npixlist,gp,u,-u):
+					f.write("%.2f, %.8f, %.8f, %.8f, %.8f\n" % ((T,) + row))
+			print(f' * sweep done upto T = {Tb[-1]} K')
 
 #
 # ---- function end ---- -------------------------------------------------------------------
@@ -173,16 +136,18 @@ csv_files = []
 pkl_files = []
 for s in range(25):
 	csv_files.append(f'nconp{s}.csv')
-	pkl_files.append(f'freq{s}.pkl')
+	pkl_files.append(f'freq{s}.npz')
 
 root = os.getcwd()
 
-# set path pkl files
+# set path frequency files - packed .npz store, older runs still have freq{s}.pkl
 for index,pklfile in enumerate(pkl_files):
 	pkl_files[index] = os.path.join(os.path.join(root,'freq_pkl'),pklfile)
+	if not os.path.exists(pkl_files[index]):
+		pkl_files[index] = os.path.splitext(pkl_files[index])[0] + '.pkl'
 
 csvlist = []
-pkllist = []
+pkllist = []		# padded frequency matrices (cm-1), one per size
 
 # logging imag freq taskids
 imlog = open("imag_freqlist.txt", "a") 
@@ -199,41 +164,29 @@ for i, (csv,pkl) in enumerate(zip(csv_files,pkl_files)):		# 'i' is for file inde
 	#	pkllist.append(pkl_df)	# pkllist -> pkl dataframe
 	#	continue
 
-	csv_df = pd.read_csv(csv)
-	pkl_df = pd.read_pickle(pkl)
+	# prefer the typed columnar table when the extractor wrote one
+	parquet = os.path.splitext(csv)[0] + '.parquet'
+	if os.path.exists(parquet):
+		csv_df = read_results(parquet,columns=['energy','taskid'])
+	else:
+		csv_df = pd.read_csv(csv)
+	freqstore = FreqStore.load(pkl)
 
 	taskid_list = csv_df['taskid'].tolist()
 
 	print(f' * processing size {i} | data count {len(csv_df)} ...')
-	_drop_cnt = 0
-	imag_freqlist = []
 
-	# 1st scan : looping imag freq
-	for struct_no, taskid in enumerate(taskid_list):
-	
-		# get frequencies of a struct with 'taskid'
-		freqlist = pkl_df[taskid]
-
-		#for freq in freqlist:
-		#	if freq < 0.:
-		#		if freq > -10e-2:
-		#			freq = 0
-		#		imag_freqlist.append(freq)
-
-		_isdropped = False
+	# padded (structures x modes) frequency matrix, rows in csv order
+	freqmat = freqstore.matrix(taskid_list)
 
-		for freq in freqlist:
-			if freq < -0.5:
-				imag_freqlist.append(taskid)
+	# imag freq mask : any mode below -0.5 cm-1 drops the structure
+	imag = np.any(freqmat < -0.5,axis=1)
+	imag_freqlist = csv_df['taskid'].values[imag]
+	_drop_cnt = int(np.count_nonzero(imag))
 
-				csv_df = csv_df.drop(struct_no)
-				#print(f'dropping taskid: {taskid}')
-				_isdropped = True
-				_drop_cnt = _drop_cnt + 1
-				break
-
-		if not _isdropped:
-			pkl_df[taskid] = pkl_df[taskid][3:]
+	csv_df = csv_df[~imag].reset_index(drop=True)
+	freqmat = freqmat[~imag,3:]		# first 3 modes (translations) are not used
+	csv_df['frow'] = np.arange(len(csv_df))
 			
 	imlog.write(f' * {_drop_cnt}/{len(taskid_list)} structures with imaginary frequencies were found : ')
 	for imag_taskid in imag_freqlist:
@@ -256,7 +209,7 @@ for i, (csv,pkl) in enumerate(zip(csv_files,pkl_files)):		# 'i' is for file inde
 	print(f' | finished')
 	
 	csvlist.append(csv_df)
-	pkllist.append(pkl_df)
+	pkllist.append(freqmat)
 
 imlog.close() # close imag freq log
 #
@@ -267,7 +220,7 @@ imlog.close() # close imag freq log
 # size & concentration(x) list
 #
 sizelist = [ i for i in range(25) ]
-npxlist = np.array([ float(i)/24. for i in range(25) ], dtype=np.float128)
+npxlist = np.array([ float(i)/24. for i in range(25) ], dtype=np.float64)
 
 
 # recalibrating energy :
@@ -298,43 +251,57 @@ for s, csvdf in zip(sizelist,csvlist):
 	tmp_csvlist.append(csvdf)
 
 csvlist = tmp_csvlist
-# ---- Setting Temperature
+# ---- Setting Temperature : 'T' or a sweep 'Tmin:Tmax:dT' / 'T1,T2,...'
 try:
-	_T = np.float128(float(sys.argv[1]))
+	_Tlist = get_temperatures(sys.argv[1])
 except:
-	_T = np.float128(300.)
+	_Tlist = np.array([300.])
+_T = float(_Tlist[0])
 
-try:
-	_vib_flag = sys.argv[2]
-	if _vib_flag == '-vib':
-		_include_vib = True
-except:
-	_include_vib = False
+# '-vib' : include vibration (flags after the temperature, in any order)
+_include_vib = '-vib' in sys.argv[2:]
+
+# '-zpe' : vibration as zero point energy only (no thermal term)
+_vib_thermal = '-zpe' not in sys.argv[2:]
+
+# '-refine' : bisect the u grid near plateaus of <x>(u)
+_refine_u = '-refine' in sys.argv[2:]
+
+#
+# Chemical potential set
+#
+_bin = 3000
+_rbin = _bin - 1000
+_du  = 0.0025
+ulist = [ float(i)*_du for i in range(-_bin,+_rbin+1)]
+print(f'chemical potential u: window [ {-_bin*_du} : {+_rbin*_du} ]')
+npulist = np.array(ulist,dtype=np.float64)
+
+if len(_Tlist) > 1:
+	print(f' * start ensemble analysis - temperature sweep')
+	print(f' | temperatures (K)    = {_Tlist[0]} ... {_Tlist[-1]} ({len(_Tlist)} points)')
+	print(f' | including vibration = {_include_vib} (thermal = {_vib_thermal})')
+	_ixbin = 2000
+	npixlist = np.array([ float(i)/_ixbin for i in range(1,_ixbin+1) ],dtype=np.float64)
+	run_sweep(_Tlist,csvlist,pkllist,npxlist,npulist,npixlist,vib=_include_vib,thermal=_vib_thermal,refine=_refine_u)
+	sys.exit(0)
 
 print(f' * start ensemble analysis')
 print(f' | temperature (K)     = {_T}')
-print(f' | including vibration = {_include_vib}')
+print(f' | including vibration = {_include_vib} (thermal = {_vib_thermal})')
 
 #
 # G,Z =  def get_gz(csvdf,T,vib=False):
 #
-npGlist = np.zeros(len(csvlist),dtype=np.float128)
-npZlist = np.zeros(len(csvlist),dtype=np.float128)
+npGlist   = np.zeros(len(csvlist),dtype=np.float64)
+nplnZlist = np.zeros(len(csvlist),dtype=np.float64)
 
-for s, (csvdf,pkldf) in enumerate(zip(csvlist,pkllist)):
+for s, (csvdf,freqmat) in enumerate(zip(csvlist,pkllist)):
 
 	print(f' * processing partition function Z : size {s}')
-	#if s == 0:	# skip case s == 0 - really?
-	#	Gc,Zc = get_gz(csvdf,_T,vib=False)
-	#	print(pkldf) # expected -> None
-	#elif s > 0:
-	#	Gc,Zc = get_gz(csvdf,_T,vib=_include_vib,pkldf=pkldf)
-
-	Gc,Zc = get_gz(csvdf,_T,vib=_include_vib,pkldf=pkldf)		# MUST INCLUDE VIB FOR X = 0 Otherwise -> ERRRRRORRRRR!!!
-	#print(Gc,Zc)
-	npGlist[s] = Gc
-	npZlist[s] = Zc
-	#print(npGlist[s],npZlist[s])
+	Gc,lnZc = get_gz(csvdf,_T,vib=_include_vib,freqmat=freqmat,thermal=_vib_thermal)		# MUST INCLUDE VIB FOR X = 0 Otherwise -> ERRRRRORRRRR!!!
+	npGlist[s]   = Gc
+	nplnZlist[s] = lnZc
 
 print(f' * calculation of canonical G / Z done ...')
 '''
@@ -358,32 +325,19 @@ with open(fname,'w') as f:
 #	print(Z,Z-100000000)
 
 #
-# Chemical potential set
-#
-_bin = 3000
-_rbin = _bin - 1000
-_du  = 0.0025
-ulist = [ float(i)*_du for i in range(-_bin,+_rbin+1)]
-print(f'chemical potential u: window [ {-_bin*_du} : {+_rbin*_du} ]')
-npulist = np.array(ulist,dtype=np.float128)
-
-#
-# calculate <x> for given 'u' & '_T'
+# calculate <x> for given 'u' & '_T' - the whole u grid in one matrix operation
 #
-expect_xlist = []
-for u in ulist:
-	
-	#Zg = get_grandZ(npZlist,npxlist,u,_T)	# overflow error
-
-	npwxlist = get_wx(npZlist,npxlist,u,_T)
-	expect_x = get_expect_x(npxlist,npwxlist)
-	expect_xlist.append(expect_x)
+expect_xlist = gc.expect_x(npxlist,nplnZlist,npulist,_T)
+if _refine_u:
+	npulist,expect_xlist = gc.refine_u(npxlist,nplnZlist,npulist,_T)
+	ulist = npulist.tolist()
+	print(f' | refined u grid : {len(ulist)} points')
 
-	'''
-		note
-		(1) u vs x plot ...  chemical potential vs <x>
-		(2) x vs -u plot ... <x> vs cell voltage
-	'''
+'''
+	note
+	(1) u vs x plot ...  chemical potential vs <x>
+	(2) x vs -u plot ... <x> vs cell voltage
+'''
 #
 # inversion check
 #
@@ -411,7 +365,7 @@ with open(fname,'w') as f:
 _bin = 2000
 _dx  = 1./_bin
 ixlist = [ float(i)*_dx for i in range(1,_bin+1)]
-npixlist = np.array(ixlist,dtype=np.float128)
+npixlist = np.array(ixlist,dtype=np.float64)
 
 if _include_vib == False:
 	fname = f'vib_T{_T}_all.out'
@@ -419,8 +373,8 @@ elif _include_vib == True:
 	fname = f'vvib_T{_T}_all.out'
 with open(fname,'w') as f:
 	f.write('x_LiConc, GrandPotential, u, -u\n')
-	for x_eval in npixlist:
-		x,gp,u = get_grand_pot(x_eval,_T,npxlist,npZlist,expect_xlist,ulist)
+	xlist,gplist,uevlist = get_grand_pot(npixlist,_T,npxlist,nplnZlist,expect_xlist,npulist)
+	for x,gp,u in zip(xlist,gplist,uevlist):
 		f.write("%.8f, %.8f, %.8f, %.8f\n" % (x,gp,u,-u))
 
 '''
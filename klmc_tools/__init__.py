@@ -0,0 +1,8 @@
+"""Shared helpers for the KLMC/GULP task-farm post-processing scripts.
+
+The numbered scripts in the sibling directories put the repository root on
+``sys.path`` and import from here, e.g.::
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from klmc_tools.gout_parser import parse_gout
+"""
@@ -0,0 +1,137 @@
+"""Chunked process-pool fan-out over task directories.
+
+Every A*/ script used to submit one future per directory to a fixed 64-128
+worker pool and print one line per completion. ``map_chunked`` instead
+
+* sizes the pool from the cores Slurm actually gave the job (``worker_count``),
+* times a pilot batch (one item per worker) and groups the remaining items in
+  chunks of about ``target_seconds`` of work each, so per-future pickling and
+  IPC overhead stays small against the work itself,
+* streams ``(item, result)`` pairs back as chunks finish, and
+* reports throughput (items/s) every ``report_every`` seconds instead of a
+  line per directory.
+
+    for directory, result in map_chunked(process_directory, dirs, label="dirs"):
+        ...
+
+``fn`` must be a module-level function (it is pickled to the workers). An item
+whose call raises is reported and left out of the results.
+"""
+
+import math
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def worker_count(max_workers=None):
+    """Cores allocated to this job: Slurm first, then the CPU affinity mask."""
+    count = None
+    for var in ("SLURM_CPUS_PER_TASK", "SLURM_CPUS_ON_NODE"):
+        value = os.environ.get(var, "").split("(")[0]
+        if value.isdigit() and int(value) > 0:
+            count = int(value)
+            break
+    if count is None:
+        try:
+            count = len(os.sched_getaffinity(0))
+        except AttributeError:
+            count = os.cpu_count() or 1
+    if max_workers is not None:
+        count = min(count, max_workers)
+    return max(count, 1)
+
+
+def _run_chunk(fn, items):
+    # runs in the worker: (item, ok, result or error text) per item plus the chunk wall time
+    start = time.perf_counter()
+    out = []
+    for item in items:
+        try:
+            out.append((item, True, fn(item)))
+        except Exception as e:
+            out.append((item, False, f"{type(e).__name__}: {e}"))
+    return out, time.perf_counter() - start
+
+
+class Throughput:
+    """Rate-limited progress line: done/total and items per second."""
+
+    def __init__(self, total, label="items", report_every=10.0, stream=None):
+        self.total = total
+        self.label = label
+        self.report_every = report_every
+        self.stream = stream or sys.stdout
+        self.done = 0
+        self.start = self.last = time.perf_counter()
+
+    def update(self, n):
+        self.done += n
+        now = time.perf_counter()
+        if now - self.last >= self.report_every:
+            self.last = now
+            self._print(now)
+
+    def close(self):
+        self._print(time.perf_counter(), final=True)
+
+    def _print(self, now, final=False):
+        elapsed = max(now - self.start, 1e-9)
+        state = "done" if final else "processed"
+        print(f"{state} {self.done}/{self.total} {self.label} in {elapsed:.1f} s "
+              f"({self.done / elapsed:.1f} {self.label}/s)", file=self.stream, flush=True)
+
+
+def chunk_size(per_item_seconds, n_items, workers, target_seconds=0.5, min_chunks_per_worker=4):
+    """Items per chunk for about ``target_seconds`` of work, keeping enough chunks to balance the workers."""
+    by_cost = target_seconds / per_item_seconds if per_item_seconds > 0 else n_items
+    by_balance = math.ceil(n_items / (workers * min_chunks_per_worker)) if n_items else 1
+    return max(1, min(int(by_cost), by_balance))
+
+
+def map_chunked(fn, items, max_workers=None, chunksize=None, label="items", target_seconds=0.5,
+                report_every=10.0, initializer=None, initargs=()):
+    """Yield ``(item, fn(item))`` for every item, in completion order.
+
+    ``chunksize`` skips the pilot timing; ``initializer``/``initargs`` are passed to the pool.
+    """
+    items = list(items)
+    workers = worker_count(max_workers)
+    progress = Throughput(len(items), label=label, report_every=report_every)
+
+    def finished(future):
+        results, elapsed = future.result()
+        for item, ok, value in results:
+            if not ok:
+                print(f"{item} generated an exception: {value}")
+        progress.update(len(results))
+        return [(item, value) for item, ok, value in results if ok], elapsed / max(len(results), 1)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        rest = items
+        if chunksize is None:
+            # pilot: one item per worker, timed inside the workers
+            pilot, rest = items[:workers], items[workers:]
+            costs = []
+            for future in [executor.submit(_run_chunk, fn, [item]) for item in pilot]:
+                pairs, cost = finished(future)
+                costs.append(cost)
+                yield from pairs
+            chunksize = chunk_size(statistics.median(costs) if costs else 0.0, len(rest), workers, target_seconds)
+
+        pending = {executor.submit(_run_chunk, fn, rest[i:i + chunksize]) for i in range(0, len(rest), chunksize)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from finished(future)[0]
+
+    progress.close()
+
+
+def map_ordered(fn, items, **kwargs):
+    """``map_chunked`` results as a list in input order (for scripts that write ordered lists)."""
+    items = list(items)
+    results = dict(map_chunked(fn, items, **kwargs))
+    return [results[item] for item in items if item in results]
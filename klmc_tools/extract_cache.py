@@ -0,0 +1,78 @@
+"""Persistent cache of per-file extraction results.
+
+A small SQLite sidecar maps each output file to the payload extracted from it,
+keyed by path, mtime, size and an extractor version string. On a rerun only new
+or changed files (e.g. the restarted A* directories) have to be parsed again:
+
+    with ExtractCache(".grep_energy_cache.sqlite", version) as cache:
+        cached, stale = cache.partition(paths)
+        ...parse the stale paths...
+        cache.store(entries)
+
+Bump the version string whenever the extractor output changes; every entry
+written under another version counts as stale.
+"""
+
+import json
+import os
+import sqlite3
+
+
+def _plain(value):
+    # numpy scalars and arrays coming out of the extractors
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class ExtractCache:
+
+    def __init__(self, db_path, version):
+        self.version = str(version)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS extract ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, version TEXT, payload TEXT)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def partition(self, paths):
+        """Split ``paths`` into ({path: cached payload}, [(path, key), ...] to parse).
+
+        Paths that do not exist are left out of both.
+        """
+        known = {
+            path: (mtime_ns, size, version, payload)
+            for path, mtime_ns, size, version, payload in self.db.execute(
+                "SELECT path, mtime_ns, size, version, payload FROM extract")
+        }
+        cached = {}
+        stale = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            key = (st.st_mtime_ns, st.st_size)
+            entry = known.get(path)
+            if entry is not None and entry[:2] == key and entry[2] == self.version:
+                cached[path] = json.loads(entry[3])
+            else:
+                stale.append((path, key))
+        return cached, stale
+
+    def store(self, entries):
+        """Record ``(path, key, payload)`` entries, key being the one returned by partition()."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO extract VALUES (?, ?, ?, ?, ?)",
+                [(path, key[0], key[1], self.version, json.dumps(payload, default=_plain)) for path, key, payload in entries],
+            )
@@ -0,0 +1,337 @@
+"""Single-pass streaming parser for GULP ``.gout`` files.
+
+Each ``.gout`` is read once, front to back, through a large read buffer. Every
+line is tested against one compiled alternation of all section markers, and a
+hit is dispatched through ``SECTION_HANDLERS``. A handler receives the record,
+the marker line and the line iterator, so it can consume the rows of its own
+section (tensors, site potentials, frequencies) without a second scan.
+
+    record = parse_gout("A123/gulp_klmc.gout")
+    record.energy, record.gnorm, record.potential_stats("La")
+
+For triage only (did the job fail, what is its final energy) ``gout_status``
+reads the file backwards from the end instead, see below.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+PARSER_VERSION = 2
+
+READ_BUFFER = 4 * 1024 * 1024
+
+TAIL_BLOCK = 64 * 1024
+TAIL_LIMIT = 4 * 1024 * 1024
+
+CELL_LABELS = ("a", "b", "c", "alpha", "beta", "gamma")
+
+
+@dataclass
+class GoutRecord:
+    path: str
+    energy: float = None
+    gnorm: float = None
+    defect_energy: float = None
+    defect_gnorm: float = None
+    cell: list = None                   # a b c alpha beta gamma
+    volume: float = None
+    density: float = None
+    static_dielectric: list = None      # 3x3
+    high_freq_dielectric: list = None   # 3x3
+    bulk_modulus: float = None
+    shear_modulus: float = None
+    youngs_modulus: float = None
+    elastic_constants: list = None      # 6x6, GPa
+    site_potentials: dict = field(default_factory=dict)  # species -> core potentials (V)
+    frequencies: list = None            # cm-1
+    max_displacement: float = None
+    finished: bool = False
+    error: bool = False
+
+    @property
+    def epsilon_0(self):
+        return _trace_mean(self.static_dielectric)
+
+    @property
+    def epsilon_infinity(self):
+        return _trace_mean(self.high_freq_dielectric)
+
+    def potential_stats(self, species):
+        """Return (avg, max, min) of the core site potentials of ``species``, or zeros if absent."""
+        values = self.site_potentials.get(species)
+        if not values:
+            return 0, 0, 0
+        return sum(values) / len(values), max(values), min(values)
+
+
+def _trace_mean(tensor):
+    if tensor is None:
+        return None
+    diagonal = [tensor[i][i] for i in range(3) if tensor[i][i] is not None]
+    return sum(diagonal) / 3 if diagonal else None
+
+
+def _to_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _is_rule(line):
+    stripped = line.strip()
+    return len(stripped) > 10 and set(stripped) == {"-"}
+
+
+def _skip(lines, n):
+    for _ in range(n):
+        next(lines, None)
+
+
+def _read_matrix(lines, header_lines, size):
+    """Skip the table header and read ``size`` rows of ``label v1 .. vsize``."""
+    _skip(lines, header_lines)
+    matrix = []
+    for _ in range(size):
+        row = [_to_float(t) for t in next(lines, "").split()[1:size + 1]]
+        matrix.append(row + [None] * (size - len(row)))
+    return matrix
+
+
+# ---- section handlers: handler(record, line, lines) ---------------------------------
+
+def _final_energy(record, line, lines):
+    record.energy = _to_float(line.split()[3])
+
+
+def _final_gnorm(record, line, lines):
+    record.gnorm = _to_float(line.split()[-1])
+
+
+def _final_defect_energy(record, line, lines):
+    record.defect_energy = _to_float(line.split("=")[-1].split()[0])
+
+
+def _final_defect_gnorm(record, line, lines):
+    record.defect_gnorm = _to_float(line.split("=")[-1].split()[0])
+
+
+def _cell(record, line, lines):
+    # 'a  5.411 Angstrom  dE/de1(xx) ...' followed by the b .. gamma rows
+    cell = [_to_float(line.split()[1])]
+    for _ in CELL_LABELS[1:]:
+        tokens = next(lines, "").split()
+        cell.append(_to_float(tokens[1]) if len(tokens) > 1 else None)
+    record.cell = cell
+
+
+def _volume(record, line, lines):
+    record.volume = _to_float(line.split()[4])
+
+
+def _density(record, line, lines):
+    record.density = _to_float(line.split()[4])
+
+
+def _static_dielectric(record, line, lines):
+    record.static_dielectric = _read_matrix(lines, 4, 3)
+
+
+def _high_freq_dielectric(record, line, lines):
+    record.high_freq_dielectric = _read_matrix(lines, 4, 3)
+
+
+def _bulk_modulus(record, line, lines):
+    record.bulk_modulus = _to_float(line.split()[4])
+
+
+def _shear_modulus(record, line, lines):
+    record.shear_modulus = _to_float(line.split()[4])
+
+
+def _youngs_modulus(record, line, lines):
+    record.youngs_modulus = _to_float(line.split()[4])
+
+
+def _elastic_constants(record, line, lines):
+    record.elastic_constants = _read_matrix(lines, 4, 6)
+
+
+def _site_potentials(record, line, lines, max_header_lines=8):
+    # rows look like '  12  La  c  -32.1234  ...'; only cores are kept
+    potentials = {}
+    header_lines = 0
+    for row in lines:
+        tokens = row.split()
+        if len(tokens) >= 4 and tokens[0].isdigit():
+            if tokens[2] == "c":
+                value = _to_float(tokens[3])
+                if value is not None:
+                    potentials.setdefault(tokens[1], []).append(value)
+            header_lines = 0
+            continue
+        if potentials and (not tokens or _is_rule(row)):
+            break
+        header_lines += 1
+        if header_lines > max_header_lines:
+            break
+    record.site_potentials = potentials
+
+
+def _frequencies(record, line, lines):
+    frequencies = []
+    for row in lines:
+        tokens = row.split()
+        if not tokens:
+            if frequencies:
+                break
+            continue
+        values = [_to_float(t) for t in tokens]
+        if None in values:
+            break
+        frequencies.extend(values)
+    record.frequencies = frequencies
+
+
+def _displacement(record, line, lines, max_rows=640):
+    # 'Comparison of initial and final structures' table, 'Difference' is column 4;
+    # the header is followed by a rule, and the table ends at the next one
+    largest = record.max_displacement
+    rules = 0
+    for _ in range(max_rows):
+        row = next(lines, None)
+        if row is None:
+            break
+        if _is_rule(row):
+            rules += 1
+            if rules == 2:
+                break
+            continue
+        tokens = row.split()
+        if len(tokens) >= 5 and tokens[0].isdigit():
+            value = _to_float(tokens[4])
+            if value is not None and (largest is None or abs(value) > abs(largest)):
+                largest = value
+    record.max_displacement = largest
+
+
+def _finished(record, line, lines):
+    record.finished = True
+
+
+def _error(record, line, lines):
+    record.error = True
+
+
+SECTION_HANDLERS = {
+    "Final energy": _final_energy,
+    "Final Gnorm": _final_gnorm,
+    "Final defect energy": _final_defect_energy,
+    "Final defect Gnorm": _final_defect_gnorm,
+    "dE/de1(xx)": _cell,
+    "Non-primitive cell volume =": _volume,
+    "Density of cell = ": _density,
+    "Static dielectric constant tensor": _static_dielectric,
+    "High frequency dielectric constant tensor": _high_freq_dielectric,
+    "Bulk  Modulus (GPa)     =": _bulk_modulus,
+    "Shear Modulus (GPa)     =": _shear_modulus,
+    "Youngs Moduli (GPa)     =": _youngs_modulus,
+    "Elastic Constant Matrix: (Units=GPa)": _elastic_constants,
+    "Electrostatic potential at atomic positions": _site_potentials,
+    "Electrostatic site potentials for region 1": _site_potentials,
+    "Frequencies (cm-1)": _frequencies,
+    "Job Finished": _finished,
+    "ERROR": _error,
+}
+
+# 'Difference' is too generic a marker for every script; the ones that want the
+# largest displacement add these to their handler set
+DISPLACEMENT_HANDLERS = {
+    "Difference": _displacement,
+}
+
+
+@lru_cache(maxsize=None)
+def _marker_pattern(markers):
+    # longest first so that e.g. 'Final defect energy' never loses to a shorter prefix
+    ordered = sorted(markers, key=len, reverse=True)
+    return re.compile("|".join(re.escape(marker) for marker in ordered))
+
+
+def parse_gout(path, handlers=None):
+    """Parse ``path`` in one pass and return a GoutRecord (later sections overwrite earlier ones)."""
+    if handlers is None:
+        handlers = SECTION_HANDLERS
+    search = _marker_pattern(tuple(handlers)).search
+    record = GoutRecord(path=path)
+    with open(path, "r", buffering=READ_BUFFER, errors="replace") as file:
+        lines = iter(file)
+        for line in lines:
+            match = search(line)
+            if match is None:
+                continue
+            try:
+                handlers[match.group(0)](record, line, lines)
+            except (IndexError, ValueError) as e:
+                print(f"Error processing file {path} at marker '{match.group(0)}': {e}")
+    return record
+
+
+# ---- tail triage ---------------------------------------------------------------------
+
+def tail_lines(path, block_size=TAIL_BLOCK, max_bytes=None):
+    """Yield the lines of ``path`` last to first, seeking backwards in ``block_size`` blocks.
+
+    Only the last ``max_bytes`` are read (the whole file if None); a line cut by
+    that window is not yielded.
+    """
+    with open(path, "rb") as file:
+        pos = file.seek(0, os.SEEK_END)
+        stop = 0 if max_bytes is None else max(pos - max_bytes, 0)
+        rest = b""
+        while pos > stop:
+            size = min(block_size, pos - stop)
+            pos -= size
+            file.seek(pos)
+            lines = (file.read(size) + rest).split(b"\n")
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                yield line.rstrip(b"\r").decode(errors="replace")
+        if stop == 0 and rest:
+            yield rest.rstrip(b"\r").decode(errors="replace")
+
+
+def _status_full(path):
+    # forward scan: ERROR anywhere, first 'Final energy' line
+    error = False
+    energy = None
+    with open(path, "r", buffering=READ_BUFFER, errors="replace") as file:
+        for line in file:
+            if "ERROR" in line:
+                error = True
+            if energy is None and "Final energy" in line:
+                energy = line.rstrip("\r\n")
+    return error, energy
+
+
+def gout_status(path, max_tail=TAIL_LIMIT, full=False):
+    """Return ``(error, final energy line or None)`` for a .gout, reading from the end.
+
+    GULP stops at an ERROR, so walking back from the end the 'Final energy' line is
+    decisive: any ERROR printed after it has been seen by then. Only when neither
+    marker lies in the last ``max_tail`` bytes is the file scanned from the start
+    (``full=True`` always does that).
+    """
+    if full:
+        return _status_full(path)
+    error = False
+    for line in tail_lines(path, max_bytes=max_tail):
+        if "ERROR" in line:
+            error = True
+        if "Final energy" in line:
+            return error, line
+    if error or os.path.getsize(path) <= max_tail:
+        return error, None
+    return _status_full(path)
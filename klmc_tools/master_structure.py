@@ -0,0 +1,165 @@
+"""Master structure shared read-only with a worker pool.
+
+The nanoparticle scripts compare every task with one master structure
+(``data/Master_new.gin``: element, coordinates, CN and site type per row).
+``MasterStructure`` keeps it as flat NumPy arrays, with the strings stored as
+integer codes into small category lists, so it can live in
+``multiprocessing.shared_memory``:
+
+    with MasterStructure.from_gin("data/Master_new.gin").shared() as handle:
+        for item, result in map_chunked(work, paths, initializer=attach_worker, initargs=(handle,)):
+            ...
+
+    def work(path):
+        master = worker_master()        # attached once per worker, no copy
+        master.tree                     # KD-tree of the master sites, built once per worker
+
+The handle only holds segment names, shapes and the category lists, so a
+worker receives a few hundred bytes at start-up and every task just a path.
+``save``/``load`` do the same through memory-mapped ``.npy`` files.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ARRAYS = ("coords", "element", "cn", "type")
+
+
+def parse_rows(content, atom_types=None):
+    """``(element, x, y, z, CN, type)`` of every row with more than five fields (optionally only ``atom_types``)."""
+    rows = []
+    for line in content:
+        parts = line.strip().split()
+        if len(parts) > 5 and (atom_types is None or parts[0] in atom_types):
+            try:
+                rows.append((parts[0], float(parts[2]), float(parts[3]), float(parts[4]), parts[-2], parts[-1]))
+            except ValueError:
+                continue
+    return rows
+
+
+def _encode(values):
+    categories = sorted(set(values))
+    lookup = {value: i for i, value in enumerate(categories)}
+    return np.array([lookup[value] for value in values], dtype=np.int32), categories
+
+
+class MasterStructure:
+
+    def __init__(self, coords, element, cn, type, categories, segments=()):
+        self.coords = coords                    # (N, 3) float64
+        self.element = element                  # (N,) int32 codes into categories["element"]
+        self.cn = cn
+        self.type = type
+        self.categories = categories            # {"element": [...], "cn": [...], "type": [...]}
+        self._segments = list(segments)
+        self._tree = None
+
+    @classmethod
+    def from_gin(cls, path):
+        with open(path, "r") as f:
+            rows = parse_rows(f.readlines())
+        # one site per position: the last row wins
+        sites = {}
+        for row in rows:
+            sites[row[1:4]] = row
+        rows = list(sites.values())
+        coords = np.array([row[1:4] for row in rows], dtype=np.float64).reshape(-1, 3)
+        arrays, categories = {}, {}
+        for name, column in (("element", 0), ("cn", 4), ("type", 5)):
+            arrays[name], categories[name] = _encode([row[column] for row in rows])
+        return cls(coords, arrays["element"], arrays["cn"], arrays["type"], categories)
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import KDTree
+            self._tree = KDTree(self.coords)
+        return self._tree
+
+    def is_element(self, name):
+        codes = self.categories["element"]
+        return self.element == codes.index(name) if name in codes else np.zeros(len(self), dtype=bool)
+
+    def labels(self, field, sites):
+        """The strings of ``field`` (element/cn/type) for the site ids ``sites``."""
+        return np.asarray(self.categories[field], dtype=object)[getattr(self, field)[sites]]
+
+    # shared memory
+
+    @contextmanager
+    def shared(self):
+        """Copy the arrays into shared memory; yields the handle for ``attach`` and unlinks on exit."""
+        segments, spec = [], {}
+        try:
+            for name in ARRAYS:
+                array = np.ascontiguousarray(getattr(self, name))
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                segments.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                spec[name] = (shm.name, array.shape, array.dtype.str)
+            yield {"arrays": spec, "categories": self.categories}
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+    @classmethod
+    def attach(cls, handle):
+        """Read-only view of the arrays of a ``shared()`` handle (no copy)."""
+        arrays, segments = {}, []
+        for name, (shm_name, shape, dtype) in handle["arrays"].items():
+            shm = _open_segment(shm_name)
+            segments.append(shm)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            array.flags.writeable = False
+            arrays[name] = array
+        return cls(categories=handle["categories"], segments=segments, **arrays)
+
+    # memory-mapped files
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "categories.txt"), "w") as f:
+            for field, values in self.categories.items():
+                f.write(field + " " + " ".join(values) + "\n")
+
+    @classmethod
+    def load(cls, directory):
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        categories = {}
+        with open(os.path.join(directory, "categories.txt")) as f:
+            for line in f:
+                field, *values = line.split()
+                categories[field] = values
+        return cls(categories=categories, **arrays)
+
+
+def _open_segment(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # pool workers share the creating process's resource tracker, where the
+    # segment is already registered; the creator unlinks it
+    return shared_memory.SharedMemory(name=name)
+
+
+_worker_master = None
+
+
+def attach_worker(handle):
+    """Pool initializer: attach the shared master structure once per worker."""
+    global _worker_master
+    _worker_master = MasterStructure.attach(handle)
+
+
+def worker_master():
+    return _worker_master
@@ -0,0 +1,76 @@
+"""Nearest-neighbour distances and shell counts, periodic or not.
+
+The classification scripts need, for every vacancy or dopant, the distances
+to its k nearest sites of some species and how many of them fall in each
+coordination shell. ``Neighbours`` answers both from one KD-tree, without
+the N x M distance matrices:
+
+    la = Neighbours(la_xyz)                              # nanoparticle: open boundaries
+    la = Neighbours.from_frac(la_frac, cell)             # bulk supercell: periodic
+    la.nearest(vo_xyz, k=2)                              # (n_vo, 2) distances
+    la.shell_counts(vo_xyz, [3.0, 5.0])                  # La within 3 A, between 3 and 5 A
+    la.nearest(la_xyz, k=1, exclude_self=True)           # nearest other La
+
+With a box (orthogonal cell lengths) the tree uses scipy's periodic
+``boxsize``, so a distance is the minimum-image one and a pair across the cell
+boundary is as near as it really is. Each site is seen once, so k-nearest
+distances and radii beyond half the box do not count periodic images.
+"""
+
+import numpy as np
+from scipy.spatial import KDTree
+
+
+def _orthogonal_lengths(cell):
+    if cell is None or any(abs(angle - 90.0) > 1e-6 for angle in cell[3:6]):
+        raise ValueError("periodic neighbours need an orthogonal cell")
+    return np.array(cell[:3], dtype=np.float64)
+
+
+class Neighbours:
+
+    def __init__(self, coords, box=None):
+        """``coords`` cartesian (N, 3); ``box`` the (a, b, c) lengths of a periodic orthogonal cell, or None."""
+        self.box = None if box is None else np.asarray(box, dtype=np.float64).reshape(3)
+        self.coords = self._wrap(coords)
+        self.tree = KDTree(self.coords, boxsize=self.box)
+
+    @classmethod
+    def from_frac(cls, frac, cell):
+        """Periodic neighbours of fractional coordinates in ``cell`` = (a, b, c, alpha, beta, gamma)."""
+        lengths = _orthogonal_lengths(cell)
+        return cls(np.asarray(frac, dtype=np.float64).reshape(-1, 3) * lengths, box=lengths)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _wrap(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self.box is None:
+            return points
+        # the periodic tree wants every coordinate in [0, box)
+        wrapped = np.mod(points, self.box)
+        return np.where(wrapped >= self.box, 0.0, wrapped)
+
+    def nearest(self, points, k=1, exclude_self=False):
+        """(n, k) distances from each point to its k nearest sites, inf where there are fewer sites.
+
+        ``exclude_self`` drops the nearest site of each point; use it when the
+        points are the tree's own sites.
+        """
+        points = self._wrap(points)
+        first = 2 if exclude_self else 1
+        if not len(points) or not len(self):
+            return np.full((len(points), k), np.inf)
+        dists, _ = self.tree.query(points, k=list(range(first, first + k)))
+        return dists
+
+    def shell_counts(self, points, radii, exclude_self=False):
+        """(n, len(radii)) site counts per shell: column i counts radii[i-1] < d <= radii[i] (d <= radii[0] for i = 0)."""
+        points = self._wrap(points)
+        if not len(points) or not len(self):
+            return np.zeros((len(points), len(radii)), dtype=np.int64)
+        within = np.stack([self.tree.query_ball_point(points, r, return_length=True) for r in radii], axis=1)
+        if exclude_self:
+            within = within - 1
+        return np.diff(within, axis=1, prepend=0).astype(np.int64)
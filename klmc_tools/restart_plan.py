@@ -0,0 +1,122 @@
+"""Restart plans that rerun only the failed tasks of a KLMC task farm.
+
+The task farm runs ``run/A<n>.gin`` for ``task_start <= n <= task_end``. The old
+restart scripts set ``task_start`` to the first failure and deleted every
+``A<n>/`` from the first to the last failure, so one early failure reran (and
+threw away) thousands of finished tasks. A plan here is built from the failed
+taskids only:
+
+* ``compact_ranges`` turns them into contiguous ``(start, end)`` ranges; each
+  range is one task-farm run (``taskfarm.config`` for the first, a
+  ``taskfarm_range<k>.config`` for each further one),
+* or ``renumber_inputs`` builds a separate job directory (``restart/``) whose
+  ``run/A0..A<n-1>.gin`` are their inputs, with a ``restart_map.csv``, so one
+  run with ``task_start 0`` / ``task_end n-1`` covers them all;
+  ``apply_restart_map`` moves the finished ``restart/A<k>/`` back to
+  ``A<taskid>/`` afterwards.
+
+Only the directories of failed tasks are removed (see ``fs_ops.remove_trees``).
+"""
+
+import csv
+import os
+import re
+import shutil
+
+
+def compact_ranges(taskids):
+    """Sorted unique taskids as inclusive ``(start, end)`` runs, e.g. [3, 4, 5, 9] -> [(3, 5), (9, 9)]."""
+    ranges = []
+    for taskid in sorted(set(taskids)):
+        if ranges and taskid == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], taskid)
+        else:
+            ranges.append((taskid, taskid))
+    return ranges
+
+
+def format_ranges(ranges):
+    return ",".join(f"{start}-{end}" if start != end else f"{start}" for start, end in ranges)
+
+
+def input_taskids(run_dir="run"):
+    """Taskids of the ``A<n>.gin`` inputs in ``run_dir`` (one scandir), sorted."""
+    if not os.path.isdir(run_dir):
+        return []
+    with os.scandir(run_dir) as entries:
+        names = [entry.name for entry in entries]
+    return sorted(int(name[1:-4]) for name in names if re.match(r"^A\d+\.gin$", name))
+
+
+def set_task_range(config_path, start, end, out_path=None):
+    """Write ``task_start``/``task_end`` into a taskfarm.config (to ``out_path`` if given)."""
+    with open(config_path, "r") as f:
+        content = f.read()
+    content = re.sub(r"^task_start.*$", f"task_start {start}", content, flags=re.M)
+    content = re.sub(r"^task_end.*$", f"task_end {end}", content, flags=re.M)
+    with open(out_path or config_path, "w") as f:
+        f.write(content)
+    return out_path or config_path
+
+
+def write_range_configs(config_path, ranges):
+    """One task-farm config per range: the first in ``config_path``, the rest as taskfarm_range<k>.config."""
+    base = os.path.dirname(config_path)
+    written = []
+    # the extra ranges first, while config_path still holds the original settings
+    for k, (start, end) in enumerate(ranges[1:], start=1):
+        written.append(set_task_range(config_path, start, end, os.path.join(base, f"taskfarm_range{k}.config")))
+    if ranges:
+        written.insert(0, set_task_range(config_path, *ranges[0]))
+    return written
+
+
+def renumber_inputs(taskids, job_dir="restart", run_dir="run", config_path="taskfarm.config",
+                    extra_files=("taskfarm.slurm",), map_name="restart_map.csv"):
+    """Build a separate task-farm job in ``job_dir`` for the failed tasks.
+
+    ``run/A<taskid>.gin`` is copied to ``job_dir/run/A<k>.gin`` (k = 0, 1, ...), the
+    config gets ``task_start 0`` / ``task_end n-1`` and ``job_dir/restart_map.csv``
+    records k -> taskid. Returns the (restart_id, taskid) rows.
+    """
+    out_dir = os.path.join(job_dir, "run")
+    # inputs of an earlier plan would be rerun under the new numbering
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    rows = []
+    for taskid in sorted(set(taskids)):
+        source = os.path.join(run_dir, f"A{taskid}.gin")
+        if not os.path.exists(source):
+            print(f"File not found: {source}")
+            continue
+        shutil.copyfile(source, os.path.join(out_dir, f"A{len(rows)}.gin"))
+        rows.append((len(rows), taskid))
+
+    for name in extra_files:
+        if os.path.exists(name):
+            shutil.copyfile(name, os.path.join(job_dir, os.path.basename(name)))
+    if rows:
+        set_task_range(config_path, 0, len(rows) - 1, os.path.join(job_dir, os.path.basename(config_path)))
+
+    with open(os.path.join(job_dir, map_name), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["restart_id", "taskid"])
+        writer.writerows(rows)
+    return rows
+
+
+def apply_restart_map(job_dir="restart", root=".", map_name="restart_map.csv"):
+    """After the renumbered job: move ``job_dir/A<restart_id>/`` to ``root/A<taskid>/``; returns the moved pairs."""
+    with open(os.path.join(job_dir, map_name), newline="") as f:
+        rows = [(int(row["restart_id"]), int(row["taskid"])) for row in csv.DictReader(f)]
+    moved = []
+    for restart_id, taskid in rows:
+        source = os.path.join(job_dir, f"A{restart_id}")
+        if not os.path.isdir(source):
+            continue
+        target = os.path.join(root, f"A{taskid}")
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.move(source, target)
+        moved.append((restart_id, taskid))
+    return moved
@@ -0,0 +1,183 @@
+"""Typed columnar result tables for the extraction scripts.
+
+Extractors hand over one row per taskid together with a schema (an ordered
+``{column: dtype}`` dict) and get a Parquet or Feather file back. Readers ask
+for the columns they need and the file is memory-mapped, so nothing is
+reparsed from text:
+
+    df = read_results("energy_filtered.parquet", columns=["taskid", "Energy"])
+
+Parquet/Feather go through pyarrow; plain .csv/.txt tables are still
+accepted by ``read_results`` for older runs.
+"""
+
+import os
+
+import pandas as pd
+
+BULK_SCHEMA = {
+    "Energy": "float64",
+    "Gnorm": "float64",
+    "a": "float64",
+    "b": "float64",
+    "c": "float64",
+    "alpha": "float64",
+    "beta": "float64",
+    "gamma": "float64",
+    "V": "float64",
+    "Density": "float64",
+    "Static_xx": "float64",
+    "Static_yy": "float64",
+    "Static_zz": "float64",
+    "ε0": "float64",
+    "HighFreq_xx": "float64",
+    "HighFreq_yy": "float64",
+    "HighFreq_zz": "float64",
+    "ε∞": "float64",
+    "Bulk0": "float64",
+    "Shear0": "float64",
+    "Young0": "float64",
+    "C11": "float64",
+    "C12": "float64",
+    "C44": "float64",
+    "V_O_min": "float64",
+    "V_O_max": "float64",
+    "V_O_avg": "float64",
+    "V_La_min": "float64",
+    "V_La_max": "float64",
+    "V_La_avg": "float64",
+    "V_Ce_min": "float64",
+    "V_Ce_max": "float64",
+    "V_Ce_avg": "float64",
+    "taskid": "int64",
+}
+
+ML_SCHEMA = {
+    "Energy": "float64",
+    "Gnorm": "float64",
+    "first_freq": "float64",
+    "V_O_min": "float64",
+    "V_O_max": "float64",
+    "V_O_avg": "float64",
+    "V_Gd_min": "float64",
+    "V_Gd_max": "float64",
+    "V_Gd_avg": "float64",
+    "V_Ce_min": "float64",
+    "V_Ce_max": "float64",
+    "V_Ce_avg": "float64",
+    "d1x": "float64",
+    "d1y": "float64",
+    "d1z": "float64",
+    "d2x": "float64",
+    "d2y": "float64",
+    "d2z": "float64",
+    "d3x": "float64",
+    "d3y": "float64",
+    "d3z": "float64",
+    "d4x": "float64",
+    "d4y": "float64",
+    "d4z": "float64",
+    "max_displacement": "float64",
+    "taskid": "string",
+}
+
+_NP_FLOATS = "Energy Gnorm d_La_avg d_VO_avg La_25 La_50 La_75 VO_25 VO_50 VO_75"
+_NP_COUNTS = "VO_bulk VO_surface Ce_bulk Ce_surface O_bulk O_surface La_bulk La_surface"
+_NP_RATIOS = ("ratio_VO_bulk ratio_La_bulk ratio_VO_surface ratio_La_surface ratio_bulk ratio_surface "
+              "d_VO_La1_bulk d_VO_La1_surface d_VO_La1_total d_VO_La2_bulk d_VO_La2_surface d_VO_La2_total "
+              "d_VO_VO_bulk d_VO_VO_surface d_VO_VO_total d_La_La_bulk d_La_La_surface d_La_La_total")
+_NP_SHELLS = ("n_2N_bulk n_2N_surface n_3N_bulk n_3N_surface n_fN_bulk n_fN_surface "
+              "n2_2N_bulk n2_2N_surface n2_3N_bulk n2_3N_surface n2_fN_bulk n2_fN_surface "
+              "n_VO_100_bulk n_VO_100_surface n_VO_110_bulk n_VO_110_surface n_VO_111_bulk n_VO_111_surface "
+              "n_VO_far_bulk n_VO_far_surface n_La_1N_bulk n_La_1N_surface n_La_2N_bulk n_La_2N_surface "
+              "n_La_far_bulk n_La_far_surface")
+
+NP_SCHEMA = {
+    **{name: "float64" for name in _NP_FLOATS.split()},
+    **{name: "int64" for name in _NP_COUNTS.split()},
+    **{name: "float64" for name in _NP_RATIOS.split()},
+    **{name: "int64" for name in _NP_SHELLS.split()},
+    "taskid": "int64",
+}
+
+TASK_STATUS_SCHEMA = {
+    "directory": "string",
+    "status": "string",
+    "has_output": "bool",
+    "error": "bool",
+    "energy": "float64",
+    "taskid": "int64",
+}
+
+SYMMETRY_SCHEMA = {
+    "taskid": "int64",
+    "orbit_key": "string",          # hash of the canonical (smallest) image of the configuration
+    "representative": "int64",      # taskid kept for this orbit
+    "duplicates": "int64",          # inputs of the orbit among the generated ones
+    "multiplicity": "int64",        # configurations in the orbit (Boltzmann degeneracy)
+}
+
+
+SITE_SCHEMA = {
+    "site_id": "int32",
+    "species": "string",
+    "x": "float64",                 # fractional, as matched in the master structure
+    "y": "float64",
+    "z": "float64",
+}
+
+VACANCY_SCHEMA = {
+    "taskid": "int64",
+    "site_id": "int32",
+}
+
+VO_CLASS_SCHEMA = {
+    "taskid": "int64",
+    "site_id": "int32",
+    "d1": "float64",                # nearest La
+    "d2": "float64",                # second nearest La
+    "N1": "string",
+    "N2": "string",
+    "d3": "float64",                # nearest other vacancy
+    "VO_Class": "string",
+    "n_La_2N": "int64",             # La within 3 A
+    "n_La_3N": "int64",             # La between 3 and 5 A
+}
+
+LA_CLASS_SCHEMA = {
+    "taskid": "int64",
+    "site_id": "int32",
+    "d4": "float64",                # nearest other La
+    "La_Class": "string",
+}
+
+
+def to_frame(rows, schema):
+    """Build a DataFrame from dict rows, with exactly the schema's columns and dtypes."""
+    df = pd.DataFrame.from_records(list(rows), columns=list(schema))
+    return df.astype(schema)
+
+
+def write_results(df, path):
+    """Write ``df`` to ``path``; the extension (.parquet or .feather) picks the format."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        df.to_parquet(path, index=False)
+    elif ext == ".feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        raise ValueError(f"Unsupported results format: {path}")
+    return path
+
+
+def read_results(path, columns=None):
+    """Read ``columns`` (all if None) of a results table, memory-mapping Parquet/Feather files."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    if ext == ".feather":
+        from pyarrow import feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if ext == ".csv":
+        return pd.read_csv(path, usecols=columns)
+    return pd.read_csv(path, sep=r'\s+', usecols=columns)
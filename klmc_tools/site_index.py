@@ -0,0 +1,188 @@
+"""Integer site index of a KLMC bulk master structure, and its symmetry.
+
+``Master.gin`` lists every lattice site of the supercell (the rows carrying
+the ``0 1 0 1 1 1`` columns); each ``A<n>.gin`` that KLMC generates is the
+master with some sites left out (vacancies) or given another species
+(dopants). ``SiteIndex`` numbers the master sites once, coordinate -> site id,
+so a configuration becomes one integer label per site:
+
+    0            vacant
+    code(name)   occupied by species ``name`` (a CRC32, stable across processes)
+
+``space_group_permutations`` expresses the symmetry operations of the
+supercell (point operations of the cubic cell combined with the translations
+that map the lattice onto itself) as site permutations, and
+``canonical_key`` hashes one canonical image of a label array over them, so
+equivalent configurations share one key.
+
+    index = SiteIndex.from_gin("../data/Master.gin")
+    bits, _ = index.occupied_bits(read_atom_rows("A12.gin"))
+    index.vacant_sites(bits)                                # vacancies as site ids
+    perms = index.space_group_permutations()
+    key, multiplicity = canonical_key(index.labels(read_atom_rows("A12.gin")), perms)
+"""
+
+import hashlib
+import zlib
+
+import numpy as np
+
+from klmc_tools.symmetry import cubic_operations
+
+ATOM_FLAGS = "0 1 0 1 1 1"
+
+GRID = 1000         # fractional coordinates are matched on a 1/GRID grid
+
+
+def species_code(name):
+    return zlib.crc32(name.encode()) or 1
+
+
+def read_atom_rows(path, flags=ATOM_FLAGS):
+    """``(species, (x, y, z))`` of every row carrying ``flags``."""
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            if flags in line:
+                fields = line.split()
+                rows.append((fields[0], tuple(float(x) for x in fields[2:5])))
+    return rows
+
+
+def read_cell(path):
+    """``(a, b, c, alpha, beta, gamma)`` from the line after ``cell``, and whether coordinates are ``cart``."""
+    cell, cart = None, False
+    with open(path, "r") as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        keyword = line.split()[:1]
+        if keyword == ["cell"] and i + 1 < len(lines):
+            cell = tuple(float(x) for x in lines[i + 1].split()[:6])
+        elif keyword == ["cart"]:
+            cart = True
+    return cell, cart
+
+
+def _cart_to_frac(coords, cell):
+    if cell is None or any(abs(angle - 90.0) > 1e-6 for angle in cell[3:]):
+        raise ValueError("cart coordinates need an orthogonal cell")
+    return coords / np.array(cell[:3])
+
+
+class SiteIndex:
+
+    def __init__(self, species, frac, cell=None, cart=False):
+        self.species = list(species)
+        self.frac = np.mod(np.asarray(frac, dtype=np.float64), 1.0)
+        self.cell = cell
+        self.cart = cart
+        self.codes = np.array([species_code(name) for name in self.species], dtype=np.int64)
+        self._ids = {key: i for i, key in enumerate(self._keys(self.frac))}
+        if len(self._ids) != len(self.species):
+            raise ValueError("master structure has sites closer than 1/GRID in fractional coordinates")
+
+    @classmethod
+    def from_gin(cls, path, flags=ATOM_FLAGS):
+        cell, cart = read_cell(path)
+        rows = read_atom_rows(path, flags)
+        # core and shell rows of one atom share the site
+        seen, species, coords = set(), [], []
+        for name, xyz in rows:
+            if xyz not in seen:
+                seen.add(xyz)
+                species.append(name)
+                coords.append(xyz)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        return cls(species, _cart_to_frac(coords, cell) if cart else coords, cell, cart)
+
+    def __len__(self):
+        return len(self.species)
+
+    def to_frac(self, coords):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        return _cart_to_frac(coords, self.cell) if self.cart else coords
+
+    @staticmethod
+    def _keys(frac):
+        grid = np.mod(np.rint(np.asarray(frac) * GRID).astype(np.int64), GRID)
+        return [tuple(row) for row in grid.tolist()]
+
+    def site_ids(self, coords):
+        """Site id of every coordinate row, -1 where no master site is."""
+        return np.array([self._ids.get(key, -1) for key in self._keys(np.mod(self.to_frac(coords), 1.0))],
+                        dtype=np.int64)
+
+    def labels(self, rows):
+        """Label array (0 = vacant, else the species code) of a configuration given as atom rows."""
+        labels = np.zeros(len(self), dtype=np.int64)
+        if not rows:
+            return labels
+        ids = self.site_ids([xyz for _, xyz in rows])
+        if np.any(ids < 0):
+            raise ValueError(f"{int(np.count_nonzero(ids < 0))} atoms are not on a master site")
+        labels[ids] = [species_code(name) for name, _ in rows]
+        return labels
+
+    def occupied_bits(self, rows):
+        """Packed bitset (np.packbits) of the master sites occupied by the atom rows; also the unmatched row count."""
+        ids = self.site_ids([xyz for _, xyz in rows]) if rows else np.zeros(0, dtype=np.int64)
+        occupied = np.zeros(len(self), dtype=bool)
+        occupied[ids[ids >= 0]] = True
+        return np.packbits(occupied), int(np.count_nonzero(ids < 0))
+
+    def vacant_sites(self, bits):
+        """Site ids missing from an ``occupied_bits`` bitset."""
+        vacant = np.packbits(np.ones(len(self), dtype=bool)) & ~bits
+        return np.flatnonzero(np.unpackbits(vacant, count=len(self)))
+
+    def _point_operations(self):
+        # a point operation may only exchange axes of equal length
+        lengths = np.array(self.cell[:3]) if self.cell else np.ones(3)
+        ops = []
+        for op in cubic_operations():
+            axes = np.abs(op).argmax(axis=1)
+            if np.allclose(lengths, lengths[axes], rtol=1e-6):
+                ops.append(op)
+        return ops
+
+    def space_group_permutations(self):
+        """The supercell's symmetry operations (that keep the master species) as site permutations."""
+        if not len(self):
+            return np.zeros((1, 0), dtype=np.int64)
+        perms = set()
+        same = np.flatnonzero(self.codes == self.codes[0])
+        for op in self._point_operations():
+            rotated = self.frac @ op.T
+            for j in same:
+                # every translation that brings the image of site 0 onto a site of its species
+                moved = rotated + (self.frac[j] - rotated[0])
+                perm = [self._ids.get(key, -1) for key in self._keys(moved)]
+                if min(perm) < 0 or len(set(perm)) != len(perm):
+                    continue
+                perm = np.array(perm, dtype=np.int64)
+                if np.array_equal(self.codes[perm], self.codes):
+                    perms.add(tuple(perm.tolist()))
+        return np.array(sorted(perms), dtype=np.int64)
+
+
+def canonical_key(labels, perms):
+    """Hash of the canonical image of ``labels`` over ``perms``, and the orbit size (distinct images).
+
+    ``perms[g]`` maps site i to site perms[g, i], so the image has label
+    ``labels[i]`` at site ``perms[g, i]``. Images are compared through a 64-bit
+    row fingerprint; the canonical image is the one with the smallest.
+    """
+    images = np.empty((len(perms), len(labels)), dtype=np.int64)
+    np.put_along_axis(images, perms, np.broadcast_to(labels, images.shape), axis=1)
+    fingerprints = images @ _fingerprint_weights(len(labels))       # wraps around, fine for hashing
+    first = int(np.argmin(fingerprints))
+    return hashlib.blake2b(images[first].tobytes(), digest_size=16).hexdigest(), len(np.unique(fingerprints))
+
+
+_weights = {}
+
+
+def _fingerprint_weights(n):
+    if n not in _weights:
+        _weights[n] = np.random.default_rng(20240607).integers(1, 2 ** 62, size=n, dtype=np.int64) | 1
+    return _weights[n]
@@ -0,0 +1,186 @@
+"""Declarative stage transitions: next-stage task-farm inputs from ``gulp.res``.
+
+Every stage script (bulk rigid -> shell -> conp -> rfo, nanoparticle
+shell -> full opt -> lbfgs) does the same per finished task: cut the
+``gulp.res`` restart file before its ``totalenergy`` (else ``species``) line,
+append the potential of the next stage and edit a few keywords. A stage is
+described by a ``StageSpec``
+
+    STAGE = StageSpec("shell_model_potential_rfo.txt",
+                      replacements=(("opti ", "opti conp comp prop phonon pot"),))
+
+and ``regenerate_inputs`` builds ``A<n>.gin`` for every task of a data
+directory in memory and writes it once, straight into ``run/`` (no copy in
+the task directory). Workers only get absolute paths (no ``os.chdir``); the
+potential text is read once by the parent and handed to every worker by the
+pool initializer.
+
+``check_outputs`` is the error/energy triage of the finished stage and
+``valid_task_names`` the task list without the failed ones.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import partial
+
+from klmc_tools.executor import map_chunked
+from klmc_tools.gout_parser import gout_status
+from klmc_tools.task_scan import list_task_dirs
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    potential: str                          # file in the job directory, appended to every structure
+    replacements: tuple = ()                # (old, new) str.replace pairs on the whole new input
+    cell_flags: tuple = None                # six optimisation flags set on the ``cell`` line, e.g. (1,) * 6
+    source: str = "gulp.res"
+    cut_before: tuple = ("totalenergy", "species")
+
+
+_potential = None
+
+
+def _preload_potential(text):
+    # pool initializer: the potential block every input of the stage ends with
+    global _potential
+    _potential = text
+
+
+def read_potential(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def structure_block(lines, cut_before=StageSpec.cut_before):
+    """Lines of a restart file before the first marker found (tried in order); all lines if none is."""
+    for marker in cut_before:
+        cut = next((i for i, line in enumerate(lines) if marker in line), None)
+        if cut is not None:
+            return lines[:cut]
+    return lines
+
+
+def cell_line_index(lines):
+    """Index of the cell parameter line (the one after the ``cell`` keyword); ValueError if there is none."""
+    for i in range(len(lines) - 1):
+        if lines[i].split()[:1] == ["cell"]:
+            return i + 1
+    raise ValueError("no cell line")
+
+
+def parse_cell_line(line):
+    """``(a, b, c, alpha, beta, gamma)`` and the optimisation flags (empty when none are given)."""
+    fields = line.split()
+    if len(fields) not in (6, 12):
+        raise ValueError(f"cell line has {len(fields)} fields: {line.strip()!r}")
+    params = tuple(float(x) for x in fields[:6])
+    flags = tuple(int(x) for x in fields[6:])
+    if any(flag not in (0, 1) for flag in flags):
+        raise ValueError(f"cell flags are not 0/1: {line.strip()!r}")
+    return params, flags
+
+
+def set_cell_flags(lines, flags):
+    """Set the six cell optimisation flags structurally; returns ``(lines, changed)``.
+
+    The parameters are kept as written; only the flag fields are replaced.
+    """
+    flags = tuple(int(flag) for flag in flags)
+    i = cell_line_index(lines)
+    _, old = parse_cell_line(lines[i])
+    if old == flags:
+        return lines, False
+    line = lines[i]
+    indent = line[:len(line) - len(line.lstrip())]
+    params = line.split()[:6]
+    lines = list(lines)
+    lines[i] = indent + " ".join(params + [str(flag) for flag in flags]) + "\n"
+    return lines, True
+
+
+def build_gin(res_path, spec, potential_text):
+    """Text of the next-stage input built from one restart file, and whether its cell flags changed."""
+    with open(res_path, "r") as f:
+        lines = structure_block(f.readlines(), spec.cut_before)
+    changed = False
+    if spec.cell_flags:
+        lines, changed = set_cell_flags(lines, spec.cell_flags)
+    content = "".join(lines) + potential_text
+    for old, new in spec.replacements:
+        content = content.replace(old, new)
+    if spec.cell_flags:
+        # verify the text that is actually written (a replacement could touch the cell line)
+        out = content.splitlines()
+        if parse_cell_line(out[cell_line_index(out)])[1] != tuple(int(flag) for flag in spec.cell_flags):
+            raise ValueError(f"cell flags not set in the input built from {res_path}")
+    return content, changed
+
+
+def write_stage_input(task_dir, spec, run_dir, potential_text=None):
+    """Write ``run_dir/A<n>.gin`` atomically; ``(path, cell flags changed)``, None if the restart file is missing.
+
+    ``potential_text`` defaults to the block preloaded by the pool initializer.
+    """
+    name = os.path.basename(os.path.normpath(task_dir))
+    res_path = os.path.join(task_dir, spec.source)
+    if not os.path.exists(res_path):
+        return None
+    content, changed = build_gin(res_path, spec, _potential if potential_text is None else potential_text)
+    gin = os.path.join(run_dir, f"{name}.gin")
+    # the task farm never sees a half-written input
+    tmp = f"{gin}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, gin)
+    return gin, changed
+
+
+def regenerate_inputs(data_dir, names, spec, job_dir=None, run_dir=None, max_workers=None):
+    """New inputs for the tasks ``names`` of ``data_dir``.
+
+    Returns the task names ``(written, skipped, flags_changed)``; the last are
+    the inputs whose cell flags ``spec.cell_flags`` actually changed.
+
+    ``job_dir`` (holding the potential files) defaults to the parent of
+    ``data_dir`` and ``run_dir`` to ``job_dir/run``.
+    """
+    data_dir = os.path.abspath(data_dir)
+    job_dir = os.path.abspath(job_dir or os.path.dirname(data_dir))
+    run_dir = os.path.abspath(run_dir or os.path.join(job_dir, "run"))
+    potential_text = read_potential(os.path.join(job_dir, spec.potential))
+    write = partial(write_stage_input, spec=spec, run_dir=run_dir)
+    paths = [os.path.join(data_dir, name.strip()) for name in names]
+    written, skipped, flags_changed = [], [], []
+    for path, result in map_chunked(write, paths, max_workers=max_workers, label="inputs",
+                                    initializer=_preload_potential, initargs=(potential_text,)):
+        name = os.path.basename(path)
+        if result is None:
+            skipped.append(name)
+            continue
+        written.append(name)
+        if result[1]:
+            flags_changed.append(name)
+    key = lambda name: int(name[1:])
+    return sorted(written, key=key), sorted(skipped, key=key), sorted(flags_changed, key=key)
+
+
+def check_outputs(data_dir, gout="gulp_klmc.gout", max_workers=None):
+    """Failed task names and 'Final energy' lines (newline-terminated) of a finished stage, by taskid."""
+    data_dir = os.path.abspath(data_dir)
+    paths = [os.path.join(data_dir, name, gout) for name in list_task_dirs(data_dir)]
+    status = dict(map_chunked(gout_status, [path for path in paths if os.path.exists(path)],
+                              max_workers=max_workers, label="outputs"))
+    errors, energies = [], []
+    for path in paths:
+        failed, energy = status.get(path, (False, None))
+        if failed:
+            errors.append(os.path.basename(os.path.dirname(path)))
+        if energy:
+            energies.append(energy + "\n")
+    return errors, energies
+
+
+def valid_task_names(data_dir, errors=()):
+    """``A<n>`` task directories of ``data_dir`` minus the failed ones, sorted by taskid."""
+    failed = {os.path.basename(os.path.normpath(name.strip())) for name in errors}
+    return [name for name in list_task_dirs(data_dir) if name not in failed]
@@ -0,0 +1,81 @@
+"""Point-group operations and symmetry-unique site combinations.
+
+A defect calculation places k dopants on n candidate sites around the defect
+centre. Two choices of sites related by an operation of the centre's point
+group that also keeps the fixed defects (vacancies) in place give the same
+energy, so only one representative per orbit has to be run:
+
+    ops = stabilizer(cubic_operations(), vacancies)          # Oh -> subgroup
+    perms = site_permutations(ops, sites)                    # ops as index maps
+    for combo, multiplicity in unique_combinations(len(sites), 4, perms):
+        ...
+
+Combinations are generated lazily, in blocks, and tested with numpy: a
+combination is kept when it is the smallest (lexicographically, as sorted
+site indices) of its images, and its multiplicity is the number of distinct
+images (the orbit size), for Boltzmann weights of the representatives.
+"""
+
+from itertools import combinations, islice, permutations, product
+
+import numpy as np
+
+TOL = 1e-3
+
+
+def cubic_operations():
+    """The 48 operations of Oh as 3x3 integer matrices (signed axis permutations)."""
+    ops = []
+    for perm in permutations(range(3)):
+        for signs in product((1, -1), repeat=3):
+            op = np.zeros((3, 3), dtype=np.int64)
+            op[range(3), perm] = signs
+            ops.append(op)
+    return ops
+
+
+def _match(points, targets, tol):
+    # index of the target each point coincides with, -1 if none
+    d = np.linalg.norm(points[:, None, :] - targets[None, :, :], axis=-1)
+    idx = d.argmin(axis=1)
+    return np.where(d[np.arange(len(points)), idx] < tol, idx, -1)
+
+
+def stabilizer(ops, points, tol=TOL):
+    """Operations that map the point set ``points`` (relative to the centre) onto itself."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if not len(points):
+        return list(ops)
+    return [op for op in ops if np.all(_match(points @ op.T, points, tol) >= 0)]
+
+
+def site_permutations(ops, sites, tol=TOL):
+    """Each operation as an index permutation of ``sites``; operations that map a site off the set are dropped."""
+    sites = np.asarray(sites, dtype=np.float64).reshape(-1, 3)
+    perms = []
+    for op in ops:
+        perm = _match(sites @ op.T, sites, tol)
+        if np.all(perm >= 0) and len(set(perm.tolist())) == len(sites):
+            perms.append(perm)
+    if not perms:
+        perms.append(np.arange(len(sites)))
+    # duplicates (operations acting alike on these sites) do not change the orbits
+    return np.unique(np.array(perms, dtype=np.int64), axis=0)
+
+
+def unique_combinations(n_sites, k, perms, block=65536):
+    """Yield ``(combination, multiplicity)`` for one representative per orbit, lazily and in order."""
+    perms = np.asarray(perms, dtype=np.int64)
+    # sorted index tuples as base-n integers: lexicographic order == integer order
+    weights = n_sites ** np.arange(k - 1, -1, -1, dtype=np.int64)
+    generator = combinations(range(n_sites), k)
+    while True:
+        chunk = np.array(list(islice(generator, block)), dtype=np.int64).reshape(-1, k)
+        if not len(chunk):
+            return
+        images = np.sort(perms[:, chunk], axis=-1)              # (ops, combos, k)
+        codes = np.sort(images @ weights, axis=0)                # (ops, combos)
+        keep = codes[0] == chunk @ weights
+        multiplicity = 1 + np.count_nonzero(np.diff(codes, axis=0), axis=0)
+        for combo, m in zip(chunk[keep], multiplicity[keep]):
+            yield tuple(combo.tolist()), int(m)
@@ -0,0 +1,88 @@
+"""One-pass status scan of the A*/ task directories.
+
+The job directory is listed once with ``os.scandir`` and every task directory
+is visited once: one listing of its entries, a tail read of the ``.gout`` for
+``ERROR`` and one read of ``gulp.res`` for ``totalenergy``. Each task yields a
+status record
+
+    missing : the completion file (``gulp.res`` for bulk, ``a.xyz`` for
+              nanoparticles) is not there, the task has to be restarted
+    error   : a .gout in the directory reports ERROR
+    ok      : finished without error
+
+collected by ``scan_tasks`` into one table (``results_store.TASK_STATUS_SCHEMA``).
+"""
+
+import os
+import re
+from functools import partial
+
+from klmc_tools.executor import map_chunked
+from klmc_tools.gout_parser import gout_status
+
+TASK_DIR = re.compile(r"^A(\d+)$")
+
+def list_task_dirs(root="."):
+    """``A<taskid>`` directories directly under ``root`` (one scandir), sorted by taskid."""
+    with os.scandir(root) as entries:
+        dirs = [entry.name for entry in entries if TASK_DIR.match(entry.name) and entry.is_dir()]
+    return sorted(dirs, key=lambda name: int(name[1:]))
+
+
+def _has_error(gout_path):
+    # tail read, see gout_parser.gout_status
+    return gout_status(gout_path)[0]
+
+
+def _total_energy(res_path):
+    # returns the stripped 'totalenergy' line, as written to energy.txt
+    with open(res_path, "r", errors="replace") as file:
+        for line in file:
+            if "totalenergy" in line:
+                return line.strip()
+    return None
+
+
+def scan_task(path, sentinel="gulp.res"):
+    """Status record of one task directory (plus the raw lines the legacy text files need)."""
+    directory = os.path.basename(os.path.normpath(path))
+    with os.scandir(path) as entries:
+        names = {entry.name for entry in entries}
+
+    gouts = sorted(name for name in names if name.endswith(".gout"))
+    error_files = [os.path.join(directory, name) for name in gouts if _has_error(os.path.join(path, name))]
+
+    energy_line = _total_energy(os.path.join(path, "gulp.res")) if "gulp.res" in names else None
+    energy = None
+    if energy_line is not None:
+        try:
+            energy = float(energy_line.split()[1])
+        except (IndexError, ValueError):
+            pass
+
+    has_output = sentinel in names
+    if not has_output:
+        status = "missing"
+    elif error_files:
+        status = "error"
+    else:
+        status = "ok"
+
+    return {
+        "directory": directory,
+        "status": status,
+        "has_output": has_output,
+        "error": bool(error_files),
+        "energy": energy,
+        "taskid": int(directory[1:]),
+        "error_files": error_files,
+        "energy_line": energy_line,
+    }
+
+
+def scan_tasks(root=".", sentinel="gulp.res", max_workers=None):
+    """Scan every task directory under ``root``; returns the records sorted by taskid."""
+    paths = [os.path.join(root, name) for name in list_task_dirs(root)]
+    scan = partial(scan_task, sentinel=sentinel)
+    records = [record for _, record in map_chunked(scan, paths, max_workers=max_workers, label="dirs")]
+    return sorted(records, key=lambda record: record["taskid"])
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from klmc_tools.gout_parser import DISPLACEMENT_HANDLERS, SECTION_HANDLERS, parse_gout
+
+RULE = "  " + "-" * 80 + "\n"
+
+COMPARISON_HEADER = (
+    "  Comparison of initial and final structures : \n\n" + RULE +
+    "       Parameter   Initial value   Final value   Difference    Units      Percent\n" + RULE)
+
+CELL_ONLY_TABLE = COMPARISON_HEADER + (
+    "    Volume            1000.000000   1001.000000     1.000000    Angs**3      0.10\n"
+    "    a                   10.000000     10.010000     0.010000    Angstroms    0.10\n" + RULE)
+
+ATOM_TABLE = COMPARISON_HEADER + (
+    "    Volume            1000.000000   1001.000000     1.000000    Angs**3      0.10\n"
+    "      1 x                0.100000      0.100500     0.000500    Fractional   0.50\n"
+    "      2 y                0.250000      0.248000    -0.002000    Fractional   0.80\n" + RULE)
+
+TRAILER = (
+    "  Static dielectric constant tensor : \n\n" + RULE +
+    "              x         y         z\n" + RULE +
+    "       x    24.000     0.000     0.000\n"
+    "       y     0.000    24.000     0.000\n"
+    "       z     0.000     0.000    24.000\n" + RULE +
+    "\n  Job Finished at 12:00.00 1st January 2024\n")
+
+ML_HANDLERS = {**SECTION_HANDLERS, **DISPLACEMENT_HANDLERS}
+
+
+def write_gout(tmp_path, text):
+    path = tmp_path / "gulp_klmc.gout"
+    path.write_text("  Final energy =     -1234.56789 eV\n" + text)
+    return str(path)
+
+
+def test_cell_only_comparison_table_ends_at_its_rule(tmp_path):
+    path = write_gout(tmp_path, CELL_ONLY_TABLE + TRAILER)
+    for handlers in (None, ML_HANDLERS):
+        record = parse_gout(path, handlers=handlers)
+        assert record.finished
+        assert record.static_dielectric[0][0] == 24.0
+        assert record.max_displacement is None
+
+
+def test_displacement_is_largest_atom_difference(tmp_path):
+    path = write_gout(tmp_path, ATOM_TABLE + TRAILER)
+    record = parse_gout(path, handlers=ML_HANDLERS)
+    assert record.max_displacement == -0.002
+    assert record.finished
+    assert parse_gout(path).max_displacement is None